@@ -0,0 +1,349 @@
+"""
+Benchmark: replay synthetic Telegram updates through the bot's Dispatcher.
+
+Seeds a database (a throw-away SQLite file unless --database-url is given)
+with shops, products, sales and debts, builds the same Dispatcher the bot
+runs (routers, middlewares, FSM storage) with a Bot whose session answers
+every API call locally, and feeds Update objects for the key flows. For
+each flow it measures throughput, latency percentiles, SQL statements and
+Bot API calls per update, and writes the results as JSON, so two runs can
+be diffed before a deploy:
+
+    python bench.py --sales 50000 --iterations 200 --output before.json
+
+The outbound rate limiter is left out: it only adds deliberate delays.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SEED_BATCH_SIZE = 5000
+FIRST_TELEGRAM_ID = 10_000  # bench users are 10000, 10001, ...
+FIRST_CHAT_ID = 900_000  # one private chat per worker, so FSM states never collide
+
+
+def _message(chat_id, user_id, text, message_id=1):
+    from aiogram.types import Message
+    return Message(
+        message_id=message_id,
+        date=datetime.now(),
+        chat={"id": chat_id, "type": "private"},
+        from_user={"id": user_id, "is_bot": False, "first_name": "Bench"},
+        text=text
+    )
+
+
+def _callback(chat_id, user_id, data):
+    from aiogram.types import CallbackQuery
+    return CallbackQuery(
+        id=str(random.getrandbits(32)),
+        chat_instance="bench",
+        from_user={"id": user_id, "is_bot": False, "first_name": "Bench"},
+        message=_message(chat_id, FIRST_TELEGRAM_ID - 1, "bench"),
+        data=data
+    )
+
+
+# flow -> steps of one iteration, ("message", text) or ("callback", data),
+# given the acting user's seeded data
+FLOWS = {
+    "product_list": lambda user: [("message", "📦 Все товары")],
+    "product_page": lambda user: [("callback", f"products_next:{user['products'][0]}")],
+    "sale": lambda user: [
+        ("callback", f"sold:{random.choice(user['products'])}"),
+        ("message", f"Buyer {random.randint(1, 50)}"),
+        ("callback", "checkout:cash"),
+    ],
+    "debt_list": lambda user: [("message", "🕒 Неоплаченные")],
+    "debts_by_buyer": lambda user: [("callback", "debts_by_buyer")],
+    "report_today": lambda user: [("callback", "report_today")],
+    "report_week": lambda user: [("callback", "report_week")],
+    "report_month": lambda user: [("callback", "report_month")],
+    "report_custom": lambda user: [
+        ("callback", "report_custom"),
+        ("message", (datetime.now() - timedelta(days=random.randint(7, 90))).strftime("%Y-%m-%d")),
+        ("message", datetime.now().strftime("%Y-%m-%d")),
+    ],
+    "analytics": lambda user: [("callback", "report_analytics")],
+    "detailed_analytics": lambda user: [("callback", "detailed_analytics")],
+    "compare_periods": lambda user: [("callback", "compare_periods")],
+}
+
+
+def _local_session_class():
+    from aiogram.client.session.base import BaseSession
+
+    class LocalSession(BaseSession):
+        """Answers every Bot API call locally so only the bot's own code is timed."""
+
+        def __init__(self):
+            super().__init__()
+            self.requests = 0
+
+        async def make_request(self, bot, method, timeout=None):
+            self.requests += 1
+            if method.__returning__ is bool:
+                return True
+            return _message(getattr(method, "chat_id", None) or 0, FIRST_TELEGRAM_ID - 1,
+                            getattr(method, "text", None), self.requests)
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b""
+
+        async def close(self):
+            pass
+
+    return LocalSession
+
+
+async def seed(args):
+    """Fill an empty database with args.shops shops and their data."""
+    from sqlalchemy import select, insert
+    from database import AsyncSessionLocal
+    from models import User, Shop, Product, Sale, Debt
+    from services import rollup_service, snapshot_service
+
+    rng = random.Random(args.seed)
+    now = datetime.now()
+
+    async with AsyncSessionLocal() as session:
+        product_ids = []
+        for number in range(args.shops):
+            user_id = (await session.execute(
+                insert(User).returning(User.id),
+                [{"telegram_id": FIRST_TELEGRAM_ID + number, "name": f"Bench {number}",
+                  "location": "Bench", "language": "ru"}]
+            )).scalar_one()
+            shop_id = (await session.execute(
+                insert(Shop).returning(Shop.id),
+                [{"shop_number": number + 1, "location": "Bench", "owner_id": user_id}]
+            )).scalar_one()
+            product_ids += (await session.execute(
+                insert(Product).returning(Product.id, sort_by_parameter_order=True),
+                [
+                    {"shop_id": shop_id, "name": f"Product {number}-{i}", "quantity": 1_000_000,
+                     "price": rng.randint(100, 5000), "size_cm": str(rng.randint(10, 200)),
+                     "color": rng.choice(("red", "blue", "green")), "material": "cotton",
+                     "status": "available"}
+                    for i in range(args.products)
+                ]
+            )).scalars().all()
+
+        products = {row.id: row for row in (await session.execute(select(
+            Product.id, Product.shop_id, Product.name, Product.price,
+            Product.size_cm, Product.color, Product.material
+        ))).all()}
+
+        def sale_rows(count, credit):
+            for _ in range(count):
+                product = products[rng.choice(product_ids)]
+                quantity = rng.randint(1, 3)
+                yield {
+                    "product_id": product.id,
+                    "shop_id": product.shop_id,
+                    "product_name": product.name,
+                    "unit_price": product.price,
+                    "size_cm": product.size_cm,
+                    "color": product.color,
+                    "material": product.material,
+                    "buyer_name": f"Buyer {rng.randint(1, 500)}",
+                    "quantity": quantity,
+                    "price": product.price * quantity,
+                    "payment_type": "borrowed" if credit else rng.choice(("cash", "card")),
+                    "is_cleared": not credit,
+                    "created_at": now - timedelta(minutes=rng.randint(0, 90 * 24 * 60)),
+                }
+
+        for credit, total in ((False, args.sales), (True, args.debts)):
+            rows = sale_rows(total, credit)
+            for start in range(0, total, SEED_BATCH_SIZE):
+                batch = [next(rows) for _ in range(min(SEED_BATCH_SIZE, total - start))]
+                if not credit:
+                    await session.execute(insert(Sale), batch)
+                    continue
+                sales = (await session.execute(
+                    insert(Sale).returning(Sale.id, Sale.price, Sale.created_at, sort_by_parameter_order=True),
+                    batch
+                )).all()
+                await session.execute(insert(Debt), [
+                    {"sale_id": sale.id, "total_amount": sale.price, "paid_amount": 0,
+                     "is_settled": False, "created_at": sale.created_at}
+                    for sale in sales
+                ])
+
+        await rollup_service.rebuild(session)
+        await session.commit()
+
+        # As after a night in production: analytics read snapshot + delta
+        await snapshot_service.take_snapshots(session, push=False)
+
+
+async def load_users(shops):
+    """Telegram ID and product IDs of each bench user."""
+    from sqlalchemy import select
+    from database import AsyncSessionLocal
+    from models import User, Shop, Product
+
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(User.telegram_id, Product.id)
+            .join(Shop, Shop.owner_id == User.id)
+            .join(Product, Product.shop_id == Shop.id)
+            .where(User.telegram_id.between(FIRST_TELEGRAM_ID, FIRST_TELEGRAM_ID + shops - 1))
+            .order_by(User.telegram_id, Product.id)
+        )).all()
+
+    users = {}
+    for telegram_id, product_id in rows:
+        users.setdefault(telegram_id, {"id": telegram_id, "products": []})["products"].append(product_id)
+    if not users:
+        raise SystemExit("No bench users in the database: run without --skip-seed first.")
+    return list(users.values())
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+async def run_flow(dp, bot, name, users, iterations, concurrency):
+    import metrics
+    from aiogram.types import Update
+
+    latencies, errors = [], []
+    queries_before = metrics.DB_QUERIES.values.get((), 0)
+    requests_before = bot.session.requests
+    next_iteration = iter(range(iterations))
+
+    async def worker(number):
+        chat_id = FIRST_CHAT_ID + number
+        for i in next_iteration:
+            user = users[i % len(users)]
+            for kind, value in FLOWS[name](user):
+                event = (
+                    {"message": _message(chat_id, user["id"], value)} if kind == "message"
+                    else {"callback_query": _callback(chat_id, user["id"], value)}
+                )
+                update = Update(update_id=i, **event)
+                started = time.perf_counter()
+                try:
+                    await dp.feed_update(bot, update)
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    updates = len(latencies)
+    latencies.sort()
+    return {
+        "updates": updates,
+        "seconds": round(elapsed, 4),
+        "updates_per_second": round(updates / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            label: round(percentile(latencies, p) * 1000, 3)
+            for label, p in (("p50", 50), ("p90", 90), ("p95", 95), ("p99", 99), ("max", 100))
+        },
+        "queries_per_update": round((metrics.DB_QUERIES.values.get((), 0) - queries_before) / updates, 2),
+        "api_calls_per_update": round((bot.session.requests - requests_before) / updates, 2),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+    }
+
+
+async def benchmark(args):
+    # Application modules read DATABASE_URL when first imported
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
+    from database import init_db, engine
+    from fsm_storage import build_storage
+    from main import build_dispatcher
+
+    await init_db()
+    if not args.skip_seed:
+        print(f"🔹 Seeding {args.shops} shops, {args.shops * args.products} products, "
+              f"{args.sales} sales, {args.debts} debts...", file=sys.stderr)
+        started = time.perf_counter()
+        await seed(args)
+        print(f"✅ Seeded in {time.perf_counter() - started:.1f} s.", file=sys.stderr)
+
+    users = await load_users(args.shops)
+    bot = Bot("1:bench", session=_local_session_class()(), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    storage = build_storage()
+    dp = build_dispatcher(storage)
+
+    results = {}
+    try:
+        for name in args.flows:
+            print(f"🔹 {name}...", file=sys.stderr)
+            random.seed(args.seed)
+            if args.warmup:
+                await run_flow(dp, bot, name, users, args.warmup, 1)
+            results[name] = await run_flow(dp, bot, name, users, args.iterations, args.concurrency)
+    finally:
+        await storage.close()
+        await engine.dispose()
+
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "database": engine.url.get_backend_name(),
+        "volumes": {"shops": args.shops, "products_per_shop": args.products,
+                    "sales": args.sales, "debts": args.debts},
+        "iterations": args.iterations,
+        "concurrency": args.concurrency,
+        "flows": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic updates through the bot and time them")
+    parser.add_argument("--database-url", help="scratch database to use (default: a new SQLite file)")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse data seeded by an earlier run")
+    parser.add_argument("--shops", type=int, default=5)
+    parser.add_argument("--products", type=int, default=200, help="products per shop")
+    parser.add_argument("--sales", type=int, default=20000, help="cleared sales in total")
+    parser.add_argument("--debts", type=int, default=2000, help="credit sales with open debts")
+    parser.add_argument("--iterations", type=int, default=100, help="iterations per flow")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed iterations per flow")
+    parser.add_argument("--concurrency", type=int, default=1, help="updates in flight at once")
+    parser.add_argument("--flows", nargs="+", choices=sorted(FLOWS), default=list(FLOWS))
+    parser.add_argument("--seed", type=int, default=1, help="random seed for data and updates")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    scratch = None
+    if not args.database_url:
+        scratch = tempfile.mkdtemp(prefix="quicksell-bench-")
+        args.database_url = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("FSM_STORAGE", "database")
+
+    # Handlers and the slow-update log print to stdout; keep it for the JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(benchmark(args))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if scratch:
+        os.remove(os.path.join(scratch, "bench.db"))
+        os.rmdir(scratch)
+
+
+if __name__ == "__main__":
+    main()
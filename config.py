@@ -5,3 +5,51 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 DATABASE_URL = os.getenv("DATABASE_URL")
+
+# FSM storage: "database" (shared, survives restarts), "redis" or "memory"
+FSM_STORAGE = os.getenv("FSM_STORAGE", "database")
+FSM_TTL = int(os.getenv("FSM_TTL", 24 * 60 * 60))  # seconds an abandoned flow is kept
+REDIS_URL = os.getenv("REDIS_URL")
+
+# Database connection pool (PostgreSQL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 240))  # Neon drops idle connections after ~5 min
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 30000))  # ms, 0 disables
+DB_USE_NEON_POOLER = os.getenv("DB_USE_NEON_POOLER", "false").lower() == "true"
+
+# Update delivery: "polling" or "webhook" (production, several replicas)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # public base URL, e.g. https://bot.example.com
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 8))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))  # per worker
+
+# /health: how long the database check may take (seconds)
+HEALTH_DB_TIMEOUT = float(os.getenv("HEALTH_DB_TIMEOUT", 2))
+
+# Slow-update profiler: updates over any threshold are logged with their callback data
+SLOW_UPDATE_MS = float(os.getenv("SLOW_UPDATE_MS", 500))  # handler time, including SQL
+SLOW_UPDATE_QUERIES = int(os.getenv("SLOW_UPDATE_QUERIES", 20))  # SQL statements per update
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))  # slowest single statement
+PROFILE_DEBUG = os.getenv("PROFILE_DEBUG", "false").lower() == "true"  # send the stats after each reply
+
+# Report snapshots, taken nightly (services/snapshot_service.py)
+SNAPSHOT_HOUR = int(os.getenv("SNAPSHOT_HOUR", 3))  # local hour, off-peak
+SNAPSHOT_PUSH = os.getenv("SNAPSHOT_PUSH", "false").lower() == "true"  # send day/week summaries to owners
+
+# Per-process cache of computed reports, invalidated by sales in this process
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", 1000))
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", 60))  # seconds; bounds staleness across replicas
+
+# Per-process cache of registered users and their shops
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))  # seconds; bounds staleness across replicas
+
+# Outbound Telegram messages (flood limits: ~30 msg/s per bot, ~1 msg/s per chat)
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", 25))  # messages per second
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", 1))  # messages per second per chat
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", 3))  # sent at once before throttling
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 5))  # retries after 429 RetryAfter
@@ -1,17 +1,155 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from config import DATABASE_URL
+import asyncio
+import time
 
-# Create sync engine
-engine = create_engine(DATABASE_URL, echo=False)
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from config import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_TIMEOUT,
+    DB_USE_NEON_POOLER,
+)
+
+
+def _neon_pooler_host(host):
+    """ep-name-123.region.aws.neon.tech -> ep-name-123-pooler.region.aws.neon.tech"""
+    if not host or not host.endswith(".neon.tech") or "-pooler." in host:
+        return host
+    endpoint, _, rest = host.partition(".")
+    return f"{endpoint}-pooler.{rest}"
+
+
+def _async_url(url):
+    """Translate a sync DATABASE_URL (psycopg2/sqlite) to its async driver."""
+    url = make_url(url)
+    connect_args = {}
+
+    if url.drivername in ("postgres", "postgresql", "postgresql+psycopg2"):
+        # asyncpg does not accept libpq's sslmode/channel_binding in the URL
+        sslmode = url.query.get("sslmode")
+        url = url.set(drivername="postgresql+asyncpg").difference_update_query(
+            ["sslmode", "channel_binding"]
+        )
+        if sslmode and sslmode != "disable":
+            connect_args["ssl"] = sslmode
+    elif url.drivername == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+
+    return url, connect_args
+
+
+def _engine_options(url, connect_args):
+    """Pool and driver settings for the engine, driven by config.py."""
+    if url.get_backend_name() != "postgresql":
+        return url, {"connect_args": connect_args}
+
+    if DB_USE_NEON_POOLER:
+        url = url.set(host=_neon_pooler_host(url.host))
+
+    if DB_STATEMENT_TIMEOUT:
+        # Client-side guard; also works through PgBouncer
+        connect_args["command_timeout"] = DB_STATEMENT_TIMEOUT / 1000
+
+    if "-pooler." in (url.host or ""):
+        # PgBouncer in transaction mode keeps neither per-connection
+        # prepared statements nor startup parameters
+        connect_args["statement_cache_size"] = 0
+        url = url.update_query_dict({"prepared_statement_cache_size": "0"})
+    elif DB_STATEMENT_TIMEOUT:
+        connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}
+
+    return url, {
+        "connect_args": connect_args,
+        "poolclass": MeteredPool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def recreate(self):
+        # dispose() swaps in a fresh pool; keep the counters
+        pool = super().recreate()
+        pool.checkouts, pool.wait_total, pool.wait_max = self.checkouts, self.wait_total, self.wait_max
+        return pool
+
+
+_url, _connect_args = _async_url(DATABASE_URL)
+_url, _engine_kwargs = _engine_options(_url, _connect_args)
+
+# Create async engine
+engine = create_async_engine(_url, echo=False, **_engine_kwargs)
 
 # Create session factory
-SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+AsyncSessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
 
 # Base class for models
 Base = declarative_base()
 
-# Initialize database (create tables)
-def init_db():
-    from models import User, Shop, Product, Sale, Debt
-    Base.metadata.create_all(bind=engine)
+# New physical connections (cold connects dominate latency on Neon)
+_connects = {"count": 0}
+
+@event.listens_for(engine.sync_engine, "connect")
+def _count_connect(dbapi_connection, connection_record):
+    _connects["count"] += 1
+
+
+def pool_status():
+    """Snapshot of connection pool utilisation."""
+    pool = engine.sync_engine.pool
+    status = {"pool": type(pool).__name__, "connects": _connects["count"]}
+
+    if isinstance(pool, MeteredPool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            checkouts=pool.checkouts,
+            wait_avg_ms=round(pool.wait_total / pool.checkouts * 1000, 2) if pool.checkouts else 0.0,
+            wait_max_ms=round(pool.wait_max * 1000, 2),
+        )
+    return status
+
+async def ping(timeout):
+    """SELECT 1 through the pool; raises on failure or after `timeout` seconds."""
+    async def select_one():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    await asyncio.wait_for(select_one(), timeout)
+
+# Initialize database (create tables, then upgrade existing ones)
+async def init_db():
+    from models import User, Shop, Product, Sale, Debt, Payment, DailySalesRollup, ReportSnapshot, AnalyticsSnapshot, FsmRecord
+    from migrations import run_migrations
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
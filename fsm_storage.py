@@ -0,0 +1,161 @@
+"""
+FSM storage backends shared by every bot worker.
+
+The default in-memory storage keeps half-finished flows (registration,
+product entry, sales, report dates) inside one process. DatabaseStorage
+keeps them in the fsm_states table instead, so any replica can continue a
+flow and a restart does not lose it. RedisStorage is used when a Redis
+(or compatible) server is configured. Both serialize data as compact JSON
+and expire flows that were abandoned for FSM_TTL seconds.
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import select, update, delete, or_, func
+
+from config import FSM_STORAGE, FSM_TTL, REDIS_URL
+from database import AsyncSessionLocal
+from models import FsmRecord
+
+
+def _encode(value):
+    # FSM data may hold datetimes (custom report period)
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode(obj):
+    if obj.keys() == {"$dt"}:
+        return datetime.fromisoformat(obj["$dt"])
+    return obj
+
+
+def dumps(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=_encode)
+
+
+def loads(raw):
+    return json.loads(raw, object_hook=_decode)
+
+
+def _build_key(key):
+    parts = [key.bot_id, key.chat_id, key.user_id]
+    if key.thread_id:
+        parts.append(key.thread_id)
+    parts.append(key.destiny)
+    return ":".join(map(str, parts))
+
+
+class DatabaseStorage(BaseStorage):
+    """FSM storage backed by the fsm_states table."""
+
+    def __init__(self, session_factory=AsyncSessionLocal, ttl=FSM_TTL):
+        self.session_factory = session_factory
+        self.ttl = timedelta(seconds=ttl) if ttl else None
+
+    def _expires_at(self):
+        return datetime.now() + self.ttl if self.ttl else None
+
+    def _alive(self):
+        return or_(FsmRecord.expires_at.is_(None), FsmRecord.expires_at > datetime.now())
+
+    async def _write(self, key, **values):
+        record_key = _build_key(key)
+        clearing = all(value is None for value in values.values())
+        values["expires_at"] = self._expires_at()
+
+        async with self.session_factory() as session:
+            # An expired flow must not be revived by a partial write
+            await session.execute(
+                delete(FsmRecord).where(FsmRecord.key == record_key, ~self._alive())
+            )
+            result = await session.execute(
+                update(FsmRecord).where(FsmRecord.key == record_key).values(**values)
+            )
+            if not result.rowcount:
+                if not clearing:
+                    session.add(FsmRecord(key=record_key, **values))
+            elif clearing:
+                # A cleared flow leaves nothing behind
+                await session.execute(
+                    delete(FsmRecord).where(
+                        FsmRecord.key == record_key,
+                        FsmRecord.state.is_(None),
+                        FsmRecord.data.is_(None)
+                    )
+                )
+            await session.commit()
+
+    async def set_state(self, key, state=None):
+        await self._write(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key):
+        async with self.session_factory() as session:
+            return await session.scalar(
+                select(FsmRecord.state).where(FsmRecord.key == _build_key(key), self._alive())
+            )
+
+    async def set_data(self, key, data):
+        await self._write(key, data=dumps(data) if data else None)
+
+    async def get_data(self, key):
+        async with self.session_factory() as session:
+            raw = await session.scalar(
+                select(FsmRecord.data).where(FsmRecord.key == _build_key(key), self._alive())
+            )
+        return loads(raw) if raw else {}
+
+    async def active_count(self):
+        """Number of flows that have not expired."""
+        async with self.session_factory() as session:
+            return await session.scalar(select(func.count()).select_from(FsmRecord).where(self._alive()))
+
+    async def purge_expired(self):
+        """Delete abandoned flows; returns the number of removed records."""
+        async with self.session_factory() as session:
+            result = await session.execute(
+                delete(FsmRecord).where(FsmRecord.expires_at <= datetime.now())
+            )
+            await session.commit()
+            return result.rowcount
+
+    async def purge_periodically(self, interval=60 * 60):
+        """Background task: purge abandoned flows every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await self.purge_expired()
+                if removed:
+                    print(f"🧹 Removed {removed} expired FSM records.")
+            except Exception as e:
+                print(f"Error purging FSM records: {e}")
+
+    async def close(self):
+        pass
+
+
+def build_storage(kind=FSM_STORAGE):
+    """Create the FSM storage selected by FSM_STORAGE."""
+    if kind == "memory":
+        return MemoryStorage()
+
+    if kind == "redis":
+        # Optional dependency: only needed when FSM_STORAGE=redis
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(
+            REDIS_URL,
+            state_ttl=FSM_TTL or None,
+            data_ttl=FSM_TTL or None,
+            json_dumps=dumps,
+            json_loads=loads
+        )
+
+    if kind == "database":
+        return DatabaseStorage()
+
+    raise ValueError(f"Unknown FSM_STORAGE: {kind}")
@@ -230,8 +230,10 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database import SessionLocal
+from database import AsyncSessionLocal
 from models import Debt, Sale, Product
+from services.debt_service import open_debts_page, outstanding_by_buyer
+from services.rollup_service import add_sale, remove_sale
 
 router = Router()
 
@@ -240,54 +242,91 @@ class PaymentState(StatesGroup):
     waiting_for_payment_type = State()
 
 # List uncleared products/debts with RETURN/PAID buttons
-@router.message(F.text == "🕒 Uncleared Products")
-async def uncleared(message: Message):
-    with SessionLocal() as session:
-        # Get all unsettled debts with related sale and product info
-        debts = session.query(Debt).filter_by(is_settled=False).all()
-        
-        if not debts:
-            await message.answer("✅ All debts are cleared!")
-            return
-        
-        for debt in debts:
-            # Get sale information
-            sale = session.query(Sale).filter_by(id=debt.sale_id).first()
-            product = None
-            buyer_name = "Unknown"
-            
-            if sale:
-                product = session.query(Product).filter_by(id=sale.product_id).first()
-                buyer_name = sale.buyer_name
-            
-            remaining = debt.total_amount - debt.paid_amount
-            
-            # Create inline keyboard with two options
-            keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [
-                        InlineKeyboardButton(
-                            text="🔙 Product Returned",
-                            callback_data=f"return:{debt.id}:{debt.sale_id}"
-                        ),
-                        InlineKeyboardButton(
-                            text="💰 Full Payment Received",
-                            callback_data=f"full_payment:{debt.id}:{debt.sale_id}"
-                        )
-                    ]
-                ]
-            )
-            
-            await message.answer(
-                f"📋 Debt ID: {debt.id}\n"
-                f"👤 Buyer: {buyer_name}\n"
-                f"📦 Product: {product.name if product else 'N/A'}\n"
-                f"💰 Total Amount: ${debt.total_amount:.2f}\n"
-                f"💵 Paid: ${debt.paid_amount:.2f}\n"
-                f"📊 Remaining: ${remaining:.2f}\n\n"
-                f"Choose action:",
-                reply_markup=keyboard
+@router.message(F.text.in_({"🕒 Uncleared Products", "🕒 Неоплаченные"}))
+async def uncleared(message: Message, shop_ids=()):
+    async with AsyncSessionLocal() as session:
+        page = await open_debts_page(session, shop_ids)
+    
+    if not page[0]:
+        await message.answer("✅ All debts are cleared!")
+        return
+    
+    text, keyboard = _render_debts_page(*page)
+    await message.answer(text, reply_markup=keyboard)
+
+# Page through open debts
+@router.callback_query(F.data.startswith(("debts_next:", "debts_prev:")))
+async def page_debts(callback: CallbackQuery, shop_ids=()):
+    direction, debt_id = callback.data.split(":")
+    debt_id = int(debt_id)
+    
+    async with AsyncSessionLocal() as session:
+        if direction == "debts_next":
+            page = await open_debts_page(session, shop_ids, after_id=debt_id)
+        else:
+            page = await open_debts_page(session, shop_ids, before_id=debt_id)
+    
+    if not page[0]:
+        await callback.message.edit_text("✅ All debts are cleared!")
+        await callback.answer()
+        return
+    
+    text, keyboard = _render_debts_page(*page)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+# Outstanding totals grouped by buyer
+@router.callback_query(F.data == "debts_by_buyer")
+async def debts_by_buyer(callback: CallbackQuery, shop_ids=()):
+    async with AsyncSessionLocal() as session:
+        buyers = await outstanding_by_buyer(session, shop_ids)
+    
+    if not buyers:
+        await callback.message.edit_text("✅ All debts are cleared!")
+        await callback.answer()
+        return
+    
+    text = "👥 Outstanding by buyer:\n\n"
+    for i, buyer in enumerate(buyers, 1):
+        text += f"{i}. {buyer.buyer_name} — ${buyer.outstanding:.2f} ({buyer.count} debts)\n"
+    
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="📋 All debts", callback_data="debts_next:0")]]
+    )
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+def _render_debts_page(rows, totals, has_prev, has_next):
+    count, outstanding = totals
+    text = f"🕒 Open debts: {count} | 📊 Outstanding: ${outstanding:.2f}\n\n"
+    buttons = []
+    
+    for debt in rows:
+        text += (
+            f"📋 #{debt.id} 👤 {debt.buyer_name} — 📦 {debt.product_name}\n"
+            f"💰 ${debt.total_amount:.2f} | 💵 ${debt.paid_amount:.2f} | 📊 ${debt.remaining:.2f}\n\n"
+        )
+        buttons.append([
+            InlineKeyboardButton(
+                text=f"🔙 #{debt.id} Returned",
+                callback_data=f"return:{debt.id}:{debt.sale_id}"
+            ),
+            InlineKeyboardButton(
+                text=f"💰 #{debt.id} Paid",
+                callback_data=f"full_payment:{debt.id}:{debt.sale_id}"
             )
+        ])
+    
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="⬅️ Prev", callback_data=f"debts_prev:{rows[0].id}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Next ➡️", callback_data=f"debts_next:{rows[-1].id}"))
+    if nav:
+        buttons.append(nav)
+    buttons.append([InlineKeyboardButton(text="👥 By buyer", callback_data="debts_by_buyer")])
+    
+    return text + "Choose action:", InlineKeyboardMarkup(inline_keyboard=buttons)
 
 # Handle product return (no sale)
 @router.callback_query(F.data.startswith("return:"))
@@ -297,14 +336,14 @@ async def handle_product_return(callback: CallbackQuery):
         debt_id = int(parts[1])
         sale_id = int(parts[2])
         
-        with SessionLocal() as session:
+        async with AsyncSessionLocal() as session:
             # Get debt and related records
-            debt = session.query(Debt).filter_by(id=debt_id).first()
-            sale = session.query(Sale).filter_by(id=sale_id).first() if sale_id else None
+            debt = await session.get(Debt, debt_id)
+            sale = await session.get(Sale, sale_id) if sale_id else None
             product = None
             
             if sale:
-                product = session.query(Product).filter_by(id=sale.product_id).first()
+                product = await session.get(Product, sale.product_id)
                 
                 # Mark debt as settled (product returned, no money)
                 debt.is_settled = True
@@ -313,20 +352,24 @@ async def handle_product_return(callback: CallbackQuery):
                 # Update product status back to available
                 if product:
                     product.status = "available"
-                    product.quantity += 1  # Increase quantity since product is back
+                    product.quantity += sale.quantity  # The returned units are back in stock
+                
+                # A cleared sale is also counted in the daily rollup
+                if sale.is_cleared:
+                    await remove_sale(session, sale)
                 
                 # Delete the sale record (since no actual sale happened)
-                session.delete(sale)
+                await session.delete(sale)
                 
-                session.commit()
+                await session.commit()
                 
                 await callback.message.edit_text(
                     f"✅ Product Return Processed!\n\n"
-                    f"📦 Product: {product.name if product else 'N/A'}\n"
+                    f"📦 Product: {sale.product_name or 'N/A'}\n"
                     f"👤 Buyer: {sale.buyer_name if sale else 'N/A'}\n"
                     f"💰 Debt #{debt.id} cleared\n"
                     f"🔄 Product status: Available\n"
-                    f"📊 Quantity: +1"
+                    f"📊 Quantity: +{sale.quantity}"
                 )
             else:
                 await callback.message.edit_text("❌ Sale record not found.")
@@ -345,10 +388,10 @@ async def handle_full_payment(callback: CallbackQuery, state: FSMContext):
         debt_id = int(parts[1])
         sale_id = int(parts[2])
         
-        with SessionLocal() as session:
+        async with AsyncSessionLocal() as session:
             # Get debt and related records
-            debt = session.query(Debt).filter_by(id=debt_id).first()
-            sale = session.query(Sale).filter_by(id=sale_id).first() if sale_id else None
+            debt = await session.get(Debt, debt_id)
+            sale = await session.get(Sale, sale_id) if sale_id else None
             
             if not debt or not sale:
                 await callback.message.edit_text("❌ Debt or sale record not found.")
@@ -374,13 +417,11 @@ async def handle_full_payment(callback: CallbackQuery, state: FSMContext):
                 ]
             )
             
-            # Get product info for message
-            product = session.query(Product).filter_by(id=sale.product_id).first()
             remaining = debt.total_amount - debt.paid_amount
             
             await callback.message.edit_text(
                 f"💰 Full Payment Received!\n\n"
-                f"📦 Product: {product.name if product else 'N/A'}\n"
+                f"📦 Product: {sale.product_name or 'N/A'}\n"
                 f"👤 Buyer: {sale.buyer_name}\n"
                 f"💵 Amount: ${remaining:.2f}\n\n"
                 f"Select payment type:",
@@ -410,17 +451,32 @@ async def _process_payment(callback: CallbackQuery, payment_type: str):
         debt_id = int(parts[1])
         sale_id = int(parts[2])
         
-        with SessionLocal() as session:
+        async with AsyncSessionLocal() as session:
             # Get debt and related records
-            debt = session.query(Debt).filter_by(id=debt_id).first()
-            sale = session.query(Sale).filter_by(id=sale_id).first()
-            product = session.query(Product).filter_by(id=sale.product_id).first() if sale else None
+            # Row lock: a double press waits here and then sees the debt settled
+            debt = await session.get(Debt, debt_id, with_for_update=True)
+            sale = await session.get(Sale, sale_id)
+            product = await session.get(Product, sale.product_id) if sale else None
             
-            if not debt or not sale or not product:
+            # The sale keeps the product's name, so a deleted product can still be paid for
+            if not debt or not sale:
                 await callback.message.edit_text("❌ Record not found.")
                 await callback.answer()
                 return
             
+            # Repeated press (e.g. from an old debt list): the sale is already counted
+            if debt.is_settled or sale.is_cleared:
+                text = "ℹ️ Debt already settled."
+                if sale.is_cleared and sale.payment_type != payment_type:
+                    # Move the sale in the rollup to the new payment type
+                    await remove_sale(session, sale)
+                    sale.payment_type = payment_type
+                    await add_sale(session, sale)
+                    await session.commit()
+                    text += f"\n💳 Payment type: {payment_type.upper()}"
+                await callback.message.edit_text(text)
+                return
+            
             # Calculate remaining amount
             remaining = debt.total_amount - debt.paid_amount
             
@@ -431,20 +487,22 @@ async def _process_payment(callback: CallbackQuery, payment_type: str):
             # Update sale
             sale.is_cleared = True
             sale.payment_type = payment_type
+            await add_sale(session, sale)
             
-            # Update product as sold
-            product.status = "sold"
+            # Update product as sold once no stock is left
             # Note: Quantity was already decreased when marked as borrowed
+            if product and product.quantity <= 0:
+                product.status = "sold"
             
-            session.commit()
+            await session.commit()
             
             await callback.message.edit_text(
                 f"✅ Payment Processed Successfully!\n\n"
-                f"📦 Product: {product.name}\n"
+                f"📦 Product: {sale.product_name or 'N/A'}\n"
                 f"👤 Buyer: {sale.buyer_name}\n"
                 f"💰 Amount: ${remaining:.2f}\n"
                 f"💳 Payment type: {payment_type.upper()}\n"
-                f"🏷️ Product status: Sold\n"
+                f"🏷️ Product status: {product.status.capitalize() if product else 'Deleted'}\n"
                 f"🎉 Debt fully settled!"
             )
                 
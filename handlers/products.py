@@ -1,84 +1,117 @@
+import tempfile
+
 from aiogram import Router, F
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
+from aiogram.filters import StateFilter
+from aiogram.types import Message, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.fsm.context import FSMContext
-from sqlalchemy.orm import Session
-from database import SessionLocal
-from models import Product, User, Shop
-from keyboards import main_menu, product_actions
+from database import AsyncSessionLocal
+from models import Product, Shop
+from money import to_money
+from keyboards import main_menu, product_page_kb
+from services.product_service import product_page
+from services.import_service import IMPORT_EXTENSIONS, read_rows, import_products
 from states import ProductState
 
 router = Router()
 
+IMPORT_ERRORS_SHOWN = 20
+
 # Список товаров (List products)
 @router.message(F.text == "📦 Все товары")
-async def list_products(message: Message):
-    with SessionLocal() as session:
-        result = session.execute(Product.__table__.select())
-        products = result.fetchall()
+async def list_products(message: Message, shop_ids=()):
+    async with AsyncSessionLocal() as session:
+        products, has_prev, has_next = await product_page(session, shop_ids)
 
     if not products:
         await message.answer("Товары не найдены.")
         return
 
-    for p in products:
-        await message.answer(
-            f"ID: {p.id}\n"
-            f"Название: {p.name}\n"
-            f"Количество: {p.quantity}\n"
-            f"Цена: {p.price}\n"
-            f"Размер: {p.size_cm} см\n"
-            f"Цвет: {p.color}\n"
-            f"Материал: {p.material}",
-            reply_markup=product_actions(p.id)
-        )
+    await message.answer(
+        _render_product_page(products),
+        reply_markup=product_page_kb(products, has_prev, has_next)
+    )
+
+# Листание каталога (Catalogue paging)
+@router.callback_query(F.data.startswith(("products_next:", "products_prev:")))
+async def page_products(callback: CallbackQuery, shop_ids=()):
+    direction, product_id = callback.data.split(":")
+    product_id = int(product_id)
+
+    async with AsyncSessionLocal() as session:
+        if direction == "products_next":
+            page = await product_page(session, shop_ids, after_id=product_id)
+        else:
+            page = await product_page(session, shop_ids, before_id=product_id)
+    products, has_prev, has_next = page
+
+    if not products:
+        await callback.answer("Больше товаров нет.")
+        return
+
+    await callback.message.edit_text(
+        _render_product_page(products),
+        reply_markup=product_page_kb(products, has_prev, has_next)
+    )
+    await callback.answer()
+
+def _render_product_page(products):
+    return "\n\n".join(
+        f"ID: {p.id}\n"
+        f"Название: {p.name}\n"
+        f"Количество: {p.quantity}\n"
+        f"Цена: {p.price}\n"
+        f"Размер: {p.size_cm} см\n"
+        f"Цвет: {p.color}\n"
+        f"Материал: {p.material}"
+        for p in products
+    )
 
 # Начало добавления товара (Start adding product)
 @router.message(F.text == "➕ Добавить товар")
-async def add_product(message: Message, state: FSMContext):
-    with SessionLocal() as session:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        
-        if not user:
-            await message.answer("❌ Пользователь не найден. Пожалуйста, введите /start.")
-            return
-        
-        shops = session.query(Shop).filter_by(owner_id=user.id).all()
-        
-        if not shops:
-            await message.answer("❌ Магазины не найдены. Сначала создайте магазин.")
-            return
-        
-        if len(shops) == 1:
-            await state.update_data(shop_id=shops[0].id)
-            await state.set_state(ProductState.name)
-            await message.answer(
-                f"Добавление товара в Магазин №{shops[0].shop_number} ({shops[0].location})\n"
-                f"Введите название товара:"
-            )
-            return
-        
-        shop_buttons = []
-        for shop in shops:
-            shop_buttons.append([
-                KeyboardButton(text=f"Магазин №{shop.shop_number} - {shop.location}")
-            ])
-        
-        shop_buttons.append([KeyboardButton(text="❌ Отмена")])
-        
-        shop_keyboard = ReplyKeyboardMarkup(
-            keyboard=shop_buttons,
-            resize_keyboard=True,
-            one_time_keyboard=True
-        )
-        
-        shop_data = {f"Магазин №{shop.shop_number} - {shop.location}": shop.id for shop in shops}
-        await state.update_data(shops=shop_data)
-        await state.set_state("waiting_for_shop_selection")
-        
+async def add_product(message: Message, state: FSMContext, profile=None):
+    if not profile:
+        await message.answer("❌ Пользователь не найден. Пожалуйста, введите /start.")
+        return
+    
+    shops = profile.shops
+    
+    if not shops:
+        await message.answer("❌ Магазины не найдены. Сначала создайте магазин.")
+        return
+    
+    if len(shops) == 1:
+        await state.update_data(shop_id=shops[0].id)
+        await state.set_state(ProductState.name)
         await message.answer(
-            "🏪 Выберите магазин для добавления товара:",
-            reply_markup=shop_keyboard
+            f"Добавление товара в Магазин №{shops[0].shop_number} ({shops[0].location})\n"
+            f"Введите название товара:\n\n"
+            f"📥 Много товаров сразу? Отправьте файл CSV/XLSX с колонками: "
+            f"название, количество, цена, размер, цвет, материал."
         )
+        return
+    
+    shop_buttons = []
+    for shop in shops:
+        shop_buttons.append([
+            KeyboardButton(text=f"Магазин №{shop.shop_number} - {shop.location}")
+        ])
+    
+    shop_buttons.append([KeyboardButton(text="❌ Отмена")])
+    
+    shop_keyboard = ReplyKeyboardMarkup(
+        keyboard=shop_buttons,
+        resize_keyboard=True,
+        one_time_keyboard=True
+    )
+    
+    shop_data = {f"Магазин №{shop.shop_number} - {shop.location}": shop.id for shop in shops}
+    await state.update_data(shops=shop_data)
+    await state.set_state("waiting_for_shop_selection")
+    
+    await message.answer(
+        "🏪 Выберите магазин для добавления товара:",
+        reply_markup=shop_keyboard
+    )
 
 # Выбор магазина (Shop selection)
 @router.message(F.text.startswith("Магазин №"))
@@ -104,6 +137,64 @@ async def select_shop(message: Message, state: FSMContext):
         reply_markup=None
     )
 
+# Импорт товаров из файла (Bulk import from CSV/XLSX)
+@router.message(
+    StateFilter(None, ProductState.name), F.document.file_name.lower().endswith(IMPORT_EXTENSIONS)
+)
+async def import_products_file(message: Message, state: FSMContext, profile=None):
+    if not profile:
+        await message.answer("❌ Пользователь не найден. Пожалуйста, введите /start.")
+        return
+    
+    shops = profile.shops
+    if await state.get_state() == ProductState.name.state:
+        # Файл вместо названия товара: магазин уже выбран в «➕ Добавить товар»
+        shop_id = (await state.get_data()).get("shop_id")
+        await state.clear()
+        shops = [shop for shop in shops if shop.id == shop_id]
+    else:
+        # Магазин: единственный или номер в подписи к файлу
+        shop_number = "".join(ch for ch in (message.caption or "") if ch.isdigit())
+        if shop_number:
+            shops = [shop for shop in shops if str(shop.shop_number) == shop_number]
+    if len(shops) != 1:
+        numbers = ", ".join(f"№{shop.shop_number}" for shop in profile.shops) or "нет"
+        await message.answer(
+            f"🏪 Укажите номер магазина в подписи к файлу (ваши магазины: {numbers})."
+        )
+        return
+    shop = shops[0]
+    
+    await message.answer(f"⏳ Импорт в Магазин №{shop.shop_number}...")
+    
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as file:
+        await message.bot.download(message.document, destination=file)
+        file.seek(0)
+        
+        async with AsyncSessionLocal() as session:
+            try:
+                rows = read_rows(file, message.document.file_name)
+                imported, errors = await import_products(session, shop.id, rows)
+            except ValueError as e:
+                await message.answer(f"❌ Файл не импортирован: {e}")
+                return
+            except ImportError:
+                await message.answer("❌ XLSX не поддерживается на сервере, отправьте CSV.")
+                return
+            except Exception as e:
+                print(f"Error importing products: {e}")
+                await message.answer("❌ Не удалось прочитать файл. Проверьте формат CSV/XLSX.")
+                return
+    
+    text = f"✅ Импортировано товаров: {imported}\n"
+    if errors:
+        text += f"❌ Строк с ошибками: {len(errors)}\n\n"
+        for line, error in errors[:IMPORT_ERRORS_SHOWN]:
+            text += f"• Строка {line}: {error}\n"
+        if len(errors) > IMPORT_ERRORS_SHOWN:
+            text += f"...и ещё {len(errors) - IMPORT_ERRORS_SHOWN}\n"
+    await message.answer(text, reply_markup=main_menu)
+
 # Обработчик отмены (Cancel handler)
 @router.message(F.text == "❌ Отмена")
 async def cancel_product_add(message: Message, state: FSMContext):
@@ -111,7 +202,7 @@ async def cancel_product_add(message: Message, state: FSMContext):
     await message.answer("❌ Добавление товара отменено.", reply_markup=main_menu)
 
 # Название товара
-@router.message(ProductState.name)
+@router.message(ProductState.name, F.text)
 async def product_name(message: Message, state: FSMContext):
     name = message.text.strip()
     if not name:
@@ -123,7 +214,7 @@ async def product_name(message: Message, state: FSMContext):
     await message.answer("Введите количество:")
 
 # Количество
-@router.message(ProductState.quantity)
+@router.message(ProductState.quantity, F.text)
 async def product_quantity(message: Message, state: FSMContext):
     try:
         quantity = int(message.text.strip())
@@ -137,21 +228,21 @@ async def product_quantity(message: Message, state: FSMContext):
         await message.answer("❌ Пожалуйста, введите корректное число для количества:")
 
 # Цена
-@router.message(ProductState.price)
+@router.message(ProductState.price, F.text)
 async def product_price(message: Message, state: FSMContext):
     try:
-        price = float(message.text.strip().replace(',', '.')) # Support both . and ,
+        price = to_money(message.text) # Support both . and ,
         if price <= 0:
             await message.answer("❌ Цена должна быть положительной. Введите цену:")
             return
-        await state.update_data(price=price)
+        await state.update_data(price=str(price))  # Decimal -> строка (данные FSM хранятся в JSON)
         await state.set_state(ProductState.size)
         await message.answer("Введите размер (см):")
     except ValueError:
         await message.answer("❌ Пожалуйста, введите корректное число для цены:")
 
 # Размер
-@router.message(ProductState.size)
+@router.message(ProductState.size, F.text)
 async def product_size(message: Message, state: FSMContext):
     size = message.text.strip()
     if not size:
@@ -163,7 +254,7 @@ async def product_size(message: Message, state: FSMContext):
     await message.answer("Введите цвет:")
 
 # Цвет
-@router.message(ProductState.color)
+@router.message(ProductState.color, F.text)
 async def product_color(message: Message, state: FSMContext):
     color = message.text.strip()
     if not color:
@@ -175,7 +266,7 @@ async def product_color(message: Message, state: FSMContext):
     await message.answer("Введите материал:")
 
 # Материал и сохранение
-@router.message(ProductState.material)
+@router.message(ProductState.material, F.text)
 async def product_material(message: Message, state: FSMContext):
     material = message.text.strip()
     if not material:
@@ -190,9 +281,9 @@ async def product_material(message: Message, state: FSMContext):
         await state.clear()
         return
     
-    with SessionLocal() as session:
+    async with AsyncSessionLocal() as session:
         try:
-            shop = session.query(Shop).filter_by(id=shop_id).first()
+            shop = await session.get(Shop, shop_id)
             if not shop:
                 await message.answer("❌ Магазин не найден. Начните сначала.")
                 await state.clear()
@@ -202,15 +293,14 @@ async def product_material(message: Message, state: FSMContext):
                 shop_id=shop_id,
                 name=data["name"],
                 quantity=data["quantity"],
-                price=data["price"],
+                price=to_money(data["price"]),
                 size_cm=data["size"],
                 color=data["color"],
                 material=material
             )
             
             session.add(product)
-            session.commit()
-            session.refresh(product)
+            await session.commit()
             
             await message.answer(
                 f"✅ Товар успешно добавлен!\n"
@@ -223,7 +313,7 @@ async def product_material(message: Message, state: FSMContext):
             
         except Exception as e:
             print(f"Error saving product: {e}")
-            session.rollback()
+            await session.rollback()
             await message.answer("❌ Ошибка при сохранении товара. Попробуйте еще раз.")
         finally:
             await state.clear()
\ No newline at end of file
@@ -1,11 +1,16 @@
+import os
+
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database import SessionLocal
-from models import Sale, Product, Shop
+from database import AsyncSessionLocal
+from services.report_service import sales_summary, period_totals
+from services.snapshot_service import current_analytics
+from services.report_cache import report_cache
+from services.export_service import EXPORTS, EXPORT_FORMATS, write_export
 from datetime import datetime, timedelta
-from collections import defaultdict
 
 router = Router()
 
@@ -23,7 +28,8 @@ async def reports_menu(message: Message):
             [InlineKeyboardButton(text="📅 Эта неделя", callback_data="report_week")],
             [InlineKeyboardButton(text="📅 Этот месяц", callback_data="report_month")],
             [InlineKeyboardButton(text="📅 Свой период", callback_data="report_custom")],
-            [InlineKeyboardButton(text="📈 Панель аналитики", callback_data="report_analytics")]
+            [InlineKeyboardButton(text="📈 Панель аналитики", callback_data="report_analytics")],
+            [InlineKeyboardButton(text="📤 Экспорт", callback_data="export_menu")]
         ]
     )
     
@@ -35,7 +41,7 @@ async def reports_menu(message: Message):
 
 # Отчет за сегодня
 @router.callback_query(F.data == "report_today")
-async def today_report(callback: CallbackQuery):
+async def today_report(callback: CallbackQuery, shop_ids=()):
     today = datetime.now().date()
     start_date = datetime.combine(today, datetime.min.time())
     end_date = datetime.combine(today, datetime.max.time())
@@ -44,12 +50,13 @@ async def today_report(callback: CallbackQuery):
         callback,
         start_date,
         end_date,
-        "📅 Продажи за сегодня"
+        "📅 Продажи за сегодня",
+        shop_ids
     )
 
 # Отчет за неделю
 @router.callback_query(F.data == "report_week")
-async def week_report(callback: CallbackQuery):
+async def week_report(callback: CallbackQuery, shop_ids=()):
     today = datetime.now().date()
     start_date = datetime.combine(today - timedelta(days=today.weekday()), datetime.min.time())
     end_date = datetime.combine(today, datetime.max.time())
@@ -58,12 +65,13 @@ async def week_report(callback: CallbackQuery):
         callback,
         start_date,
         end_date,
-        "📅 Продажи за эту неделю"
+        "📅 Продажи за эту неделю",
+        shop_ids
     )
 
 # Отчет за месяц
 @router.callback_query(F.data == "report_month")
-async def month_report(callback: CallbackQuery):
+async def month_report(callback: CallbackQuery, shop_ids=()):
     today = datetime.now().date()
     start_date = datetime.combine(today.replace(day=1), datetime.min.time())
     end_date = datetime.combine(today, datetime.max.time())
@@ -72,7 +80,8 @@ async def month_report(callback: CallbackQuery):
         callback,
         start_date,
         end_date,
-        "📅 Продажи за этот месяц"
+        "📅 Продажи за этот месяц",
+        shop_ids
     )
 
 # Начало выбора произвольного периода
@@ -101,7 +110,7 @@ async def get_start_date(message: Message, state: FSMContext):
 
 # Получение даты окончания и вывод отчета
 @router.message(ReportState.waiting_for_end_date)
-async def get_end_date(message: Message, state: FSMContext):
+async def get_end_date(message: Message, state: FSMContext, shop_ids=()):
     try:
         end_date = datetime.strptime(message.text.strip(), "%Y-%m-%d")
         data = await state.get_data()
@@ -113,7 +122,8 @@ async def get_end_date(message: Message, state: FSMContext):
             message,
             start_date,
             end_date,
-            f"📅 Период: с {start_date.strftime('%Y-%m-%d')} по {end_date.strftime('%Y-%m-%d')}"
+            f"📅 Период: с {start_date.strftime('%Y-%m-%d')} по {end_date.strftime('%Y-%m-%d')}",
+            shop_ids
         )
         await state.clear()
     except ValueError:
@@ -121,62 +131,42 @@ async def get_end_date(message: Message, state: FSMContext):
 
 # Панель аналитики
 @router.callback_query(F.data == "report_analytics")
-async def analytics_dashboard(callback: CallbackQuery):
-    with SessionLocal() as session:
-        sales = session.query(Sale).filter_by(is_cleared=True).all()
+async def analytics_dashboard(callback: CallbackQuery, shop_ids=()):
+    async with AsyncSessionLocal() as session:
+        overview = await report_cache.get_or_compute(
+            "analytics", datetime.now().date(), lambda: current_analytics(session, shop_ids), shop_ids
+        )
         
-        if not sales:
+        if not overview["total_items"]:
             await callback.message.answer("📭 Данные о продажах для аналитики отсутствуют.")
             await callback.answer()
             return
         
-        total_revenue = sum(sale.price for sale in sales)
-        total_sales = len(sales)
+        total_revenue = overview["total_amount"]
+        total_sales = overview["total_items"]
         avg_sale = total_revenue / total_sales if total_sales > 0 else 0
         
-        product_sales = defaultdict(float)
-        for sale in sales:
-            product = session.query(Product).filter_by(id=sale.product_id).first()
-            if product:
-                product_sales[product.name] += sale.price
-        
-        top_products = sorted(product_sales.items(), key=lambda x: x[1], reverse=True)[:5]
-        
-        buyer_sales = defaultdict(float)
-        for sale in sales:
-            buyer_sales[sale.buyer_name] += sale.price
-        
-        top_buyers = sorted(buyer_sales.items(), key=lambda x: x[1], reverse=True)[:5]
-        
-        daily_revenue = defaultdict(float)
-        week_ago = datetime.now() - timedelta(days=7)
-        recent_sales = [s for s in sales if s.created_at >= week_ago]
-        
-        for sale in recent_sales:
-            date_str = sale.created_at.strftime('%Y-%m-%d')
-            daily_revenue[date_str] += sale.price
-        
         analytics_text = (
             f"📈 Панель аналитики\n"
             f"━━━━━━━━━━━━━━━━━━\n"
             f"💰 Общая выручка: {total_revenue:.2f}\n"
             f"📦 Всего продаж: {total_sales} шт.\n"
-            f"📊 Средний чек: {avg_sale:.2f}\n"
+            f"📊 Средняя цена за единицу: {avg_sale:.2f}\n"
             f"📅 Период: За все время\n\n"
         )
         
         analytics_text += "🏆 Топ товаров по выручке:\n"
-        for i, (product, revenue) in enumerate(top_products, 1):
+        for i, (product, revenue) in enumerate(overview["top_products"], 1):
             analytics_text += f"{i}. {product}: {revenue:.2f}\n"
         
         analytics_text += "\n👥 Топ покупателей:\n"
-        for i, (buyer, spent) in enumerate(top_buyers, 1):
+        for i, (buyer, spent) in enumerate(overview["top_buyers"], 1):
             analytics_text += f"{i}. {buyer}: {spent:.2f}\n"
         
-        if daily_revenue:
+        if overview["daily_revenue"]:
             analytics_text += "\n📊 Выручка за последние 7 дней:\n"
-            for date_str in sorted(daily_revenue.keys())[-7:]:
-                analytics_text += f"{date_str}: {daily_revenue[date_str]:.2f}\n"
+            for date_str, revenue in overview["daily_revenue"]:
+                analytics_text += f"{date_str}: {revenue:.2f}\n"
         
         keyboard = InlineKeyboardMarkup(
             inline_keyboard=[
@@ -191,25 +181,13 @@ async def analytics_dashboard(callback: CallbackQuery):
 
 # Детальная аналитика
 @router.callback_query(F.data == "detailed_analytics")
-async def detailed_analytics(callback: CallbackQuery):
-    with SessionLocal() as session:
-        sales = session.query(Sale).filter_by(is_cleared=True).all()
-        
-        payment_methods = defaultdict(float)
-        daily_sales = defaultdict(int)
-        hourly_sales = defaultdict(int)
-        
-        for sale in sales:
-            if sale.payment_type:
-                payment_methods[sale.payment_type] += sale.price
-            
-            if sale.created_at:
-                date_str = sale.created_at.strftime('%Y-%m-%d')
-                daily_sales[date_str] += 1
-                hour = sale.created_at.hour
-                hourly_sales[hour] += 1
+async def detailed_analytics(callback: CallbackQuery, shop_ids=()):
+    async with AsyncSessionLocal() as session:
+        details = await report_cache.get_or_compute(
+            "analytics", datetime.now().date(), lambda: current_analytics(session, shop_ids), shop_ids
+        )
         
-        best_day = max(daily_sales.items(), key=lambda x: x[1]) if daily_sales else ("Н/Д", 0)
+        best_day = details["best_day"] or ("Н/Д", 0)
         
         analytics_text = (
             f"📊 Детальная аналитика\n"
@@ -217,14 +195,14 @@ async def detailed_analytics(callback: CallbackQuery):
             f"💳 Способы оплаты:\n"
         )
         
-        total_m_val = sum(payment_methods.values())
-        for method, amount in payment_methods.items():
+        total_m_val = sum(amount for _, amount in details["payment_methods"])
+        for method, amount in details["payment_methods"]:
             percentage = (amount / total_m_val) * 100 if total_m_val > 0 else 0
             m_name = "Наличные" if method == "cash" else "Карта" if method == "card" else method.upper()
             analytics_text += f"• {m_name}: {amount:.2f} ({percentage:.1f}%)\n"
         
         analytics_text += f"\n⏰ Пиковые часы:\n"
-        for hour, count in sorted(hourly_sales.items(), key=lambda x: x[1], reverse=True)[:5]:
+        for hour, count in details["peak_hours"]:
             analytics_text += f"• {hour:02d}:00 — {count} продаж\n"
         
         analytics_text += f"\n📅 Самый активный день:\n"
@@ -235,15 +213,11 @@ async def detailed_analytics(callback: CallbackQuery):
 
 # Сравнение периодов
 @router.callback_query(F.data == "compare_periods")
-async def compare_periods(callback: CallbackQuery):
-    with SessionLocal() as session:
+async def compare_periods(callback: CallbackQuery, shop_ids=()):
+    async with AsyncSessionLocal() as session:
         today = datetime.now()
         
         current_start = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        current_sales = session.query(Sale).filter(
-            Sale.is_cleared == True,
-            Sale.created_at >= current_start
-        ).all()
         
         if current_start.month == 1:
             prev_start = current_start.replace(year=current_start.year-1, month=12)
@@ -251,14 +225,17 @@ async def compare_periods(callback: CallbackQuery):
             prev_start = current_start.replace(month=current_start.month-1)
         
         prev_end = current_start - timedelta(seconds=1)
-        prev_sales = session.query(Sale).filter(
-            Sale.is_cleared == True,
-            Sale.created_at >= prev_start,
-            Sale.created_at <= prev_end
-        ).all()
         
-        current_revenue = sum(s.price for s in current_sales)
-        prev_revenue = sum(s.price for s in prev_sales)
+        async def both_months():
+            return (
+                await period_totals(session, current_start, today, shop_ids),
+                await period_totals(session, prev_start, prev_end, shop_ids)
+            )
+        
+        # Totals are by whole days, so the day identifies the result
+        (current_revenue, current_count), (prev_revenue, prev_count) = await report_cache.get_or_compute(
+            "compare_months", today.date(), both_months, shop_ids
+        )
         
         if prev_revenue > 0:
             change = ((current_revenue - prev_revenue) / prev_revenue) * 100
@@ -271,10 +248,10 @@ async def compare_periods(callback: CallbackQuery):
             f"━━━━━━━━━━━━━━━━━━\n"
             f"📅 Текущий месяц ({current_start.strftime('%m.%Y')}):\n"
             f"• Выручка: {current_revenue:.2f}\n"
-            f"• Продажи: {len(current_sales)} шт.\n\n"
+            f"• Продажи: {current_count} шт.\n\n"
             f"📅 Прошлый месяц ({prev_start.strftime('%m.%Y')}):\n"
             f"• Выручка: {prev_revenue:.2f}\n"
-            f"• Продажи: {len(prev_sales)} шт.\n\n"
+            f"• Продажи: {prev_count} шт.\n\n"
             f"📈 Рост: {change_text}"
         )
         
@@ -282,15 +259,14 @@ async def compare_periods(callback: CallbackQuery):
         await callback.answer()
 
 # Вспомогательная функция для отображения отчета
-async def show_sales_report(source, start_date, end_date, title):
-    with SessionLocal() as session:
-        sales = session.query(Sale).filter(
-            Sale.is_cleared == True,
-            Sale.created_at >= start_date,
-            Sale.created_at <= end_date
-        ).order_by(Sale.created_at.desc()).all()
+async def show_sales_report(source, start_date, end_date, title, shop_ids=()):
+    async with AsyncSessionLocal() as session:
+        summary = await report_cache.get_or_compute(
+            "sales", (start_date, end_date), lambda: sales_summary(session, start_date, end_date, shop_ids),
+            shop_ids
+        )
         
-        if not sales:
+        if not summary:
             msg = f"📭 Продажи за период '{title}' не найдены."
             if hasattr(source, 'message'):
                 await source.message.answer(msg)
@@ -299,17 +275,8 @@ async def show_sales_report(source, start_date, end_date, title):
                 await source.answer(msg)
             return
         
-        total_amount = sum(sale.price for sale in sales)
-        total_items = len(sales)
-        
-        product_counts = defaultdict(int)
-        product_revenue = defaultdict(float)
-        
-        for sale in sales:
-            product = session.query(Product).filter_by(id=sale.product_id).first()
-            if product:
-                product_counts[product.name] += 1
-                product_revenue[product.name] += sale.price
+        total_amount = summary["total_amount"]
+        total_items = summary["total_items"]
         
         report_text = (
             f"{title}\n"
@@ -317,13 +284,14 @@ async def show_sales_report(source, start_date, end_date, title):
             f"📅 Период: {start_date.strftime('%Y-%m-%d')} - {end_date.strftime('%Y-%m-%d')}\n"
             f"💰 Общая выручка: {total_amount:.2f}\n"
             f"📦 Всего продаж: {total_items} шт.\n"
-            f"📊 Средний чек: {total_amount/total_items:.2f}\n\n"
+            f"📊 Средняя цена за единицу: {total_amount/total_items:.2f}\n\n"
         )
         
         report_text += "🛒 Последние продажи:\n"
-        for sale in sales[:5]:
-            product = session.query(Product).filter_by(id=sale.product_id).first()
-            p_name = product.name if product else "Неизвестно"
+        for sale in summary["recent_sales"]:
+            p_name = sale.name or "Неизвестно"
+            if sale.quantity > 1:
+                p_name += f" × {sale.quantity}"
             time_str = sale.created_at.strftime('%H:%M') if sale.created_at else "--:--"
             p_type = "Наличные" if sale.payment_type == "cash" else "Карта" if sale.payment_type == "card" else "Н/Д"
             
@@ -332,10 +300,9 @@ async def show_sales_report(source, start_date, end_date, title):
                 f"  👤 {sale.buyer_name} | 💳 {p_type} | ⏰ {time_str}\n"
             )
         
-        if product_counts:
-            top_by_count = sorted(product_counts.items(), key=lambda x: x[1], reverse=True)[:3]
+        if summary["top_products"]:
             report_text += "\n🏆 Топ товаров (кол-во):\n"
-            for product, count in top_by_count:
+            for product, count in summary["top_products"]:
                 report_text += f"• {product}: {count} шт.\n"
         
         keyboard = InlineKeyboardMarkup(
@@ -356,19 +323,94 @@ async def show_sales_report(source, start_date, end_date, title):
         else:
             await source.answer(report_text, reply_markup=keyboard)
 
+# Меню экспорта
+@router.callback_query(F.data == "export_menu")
+async def export_menu(callback: CallbackQuery):
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="🧾 Продажи", callback_data="export:sales")],
+            [InlineKeyboardButton(text="🕒 Долги", callback_data="export:debts")],
+            [InlineKeyboardButton(text="📦 Склад", callback_data="export:products")]
+        ]
+    )
+    await callback.message.answer(
+        "📤 Экспорт в CSV за все время.\n"
+        "Период и XLSX — командой:\n"
+        "/export sales 2024-01-01 2024-01-31 xlsx\n"
+        "(sales, debts или products)",
+        reply_markup=keyboard
+    )
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("export:"))
+async def export_button(callback: CallbackQuery, profile=None):
+    kind = callback.data.split(":")[1]
+    await callback.answer()
+    await send_export(callback.message, profile, kind)
+
+# /export <sales|debts|products> [ГГГГ-ММ-ДД ГГГГ-ММ-ДД] [csv|xlsx]
+@router.message(Command("export"))
+async def export_command(message: Message, command: CommandObject, profile=None):
+    args = (command.args or "sales").split()
+    kind = args[0].lower()
+    fmt = next((arg.lower() for arg in args[1:] if arg.lower() in EXPORT_FORMATS), "csv")
+    dates = [arg for arg in args[1:] if arg.lower() not in EXPORT_FORMATS]
+    
+    if kind not in EXPORTS or len(dates) not in (0, 2):
+        await message.answer(
+            "❌ Использование: /export <sales|debts|products> [ГГГГ-ММ-ДД ГГГГ-ММ-ДД] [csv|xlsx]"
+        )
+        return
+    
+    start_date = end_date = None
+    if dates:
+        try:
+            start_date = datetime.strptime(dates[0], "%Y-%m-%d")
+            end_date = datetime.combine(datetime.strptime(dates[1], "%Y-%m-%d").date(), datetime.max.time())
+        except ValueError:
+            await message.answer("❌ Неверный формат даты. Используйте ГГГГ-ММ-ДД (напр. 2024-01-15).")
+            return
+    
+    await send_export(message, profile, kind, start_date, end_date, fmt)
+
+# Формирование файла и отправка документом
+async def send_export(message: Message, profile, kind, start_date=None, end_date=None, fmt="csv"):
+    if not profile or not profile.shops:
+        await message.answer("❌ Магазины не найдены. Пожалуйста, введите /start.")
+        return
+    
+    async with AsyncSessionLocal() as session:
+        try:
+            path, count = await write_export(session, kind, profile.shop_ids, start_date, end_date, fmt)
+        except ImportError:
+            await message.answer("❌ XLSX не поддерживается на сервере, используйте CSV.")
+            return
+    
+    try:
+        period = (
+            f"{start_date.strftime('%Y-%m-%d')}_{end_date.strftime('%Y-%m-%d')}"
+            if start_date else datetime.now().strftime('%Y-%m-%d')
+        )
+        await message.answer_document(
+            FSInputFile(path, filename=f"{kind}_{period}.{fmt}"),
+            caption=f"📤 {kind}: {count} строк"
+        )
+    finally:
+        os.remove(path)
+
 # Совместимость со старыми пунктами меню
 @router.message(F.text == "📊 Проданные товары")
 async def sold_items_legacy(message: Message):
     await reports_menu(message)
 
 @router.message(F.text == "💰 Общая выручка")
-async def total_revenue_legacy(message: Message):
-    await analytics_dashboard(message)
+async def total_revenue_legacy(message: Message, shop_ids=()):
+    await analytics_dashboard(message, shop_ids)
 
 @router.message(F.text == "📈 Ежемесячный отчет")
-async def monthly_report_legacy(message: Message):
-    await month_report(message)
+async def monthly_report_legacy(message: Message, shop_ids=()):
+    await month_report(message, shop_ids)
 
 @router.message(F.text == "📅 Дневной отчет")
-async def daily_report_legacy(message: Message):
-    await today_report(message)
\ No newline at end of file
+async def daily_report_legacy(message: Message, shop_ids=()):
+    await today_report(message, shop_ids)
\ No newline at end of file
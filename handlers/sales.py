@@ -1,10 +1,16 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
-from database import SessionLocal
-from models import Product, Sale, Debt
-from keyboards import payment_type_kb, cash_card_kb
+from database import AsyncSessionLocal
+from sqlalchemy import select
+from models import Product, Sale
+from keyboards import cash_card_kb, cart_kb, product_page_kb
 from states import SaleState
+from services.product_service import product_page
+from services.rollup_service import add_sale, remove_sale
+from services.sales_service import (
+    OutOfStock, record_sale, record_cleared_sale, record_credit_sale
+)
 
 router = Router()
 
@@ -12,18 +18,34 @@ router = Router()
 async def sold_product(callback: CallbackQuery, state: FSMContext):
     product_id = int(callback.data.split(":")[1])
     
-    with SessionLocal() as session:
+    async with AsyncSessionLocal() as session:
         # Проверка существования товара
-        product = session.query(Product).filter_by(id=product_id).first()
+        product = await session.get(Product, product_id)
         if not product:
             await callback.message.answer("❌ Товар не найден.")
             await callback.answer()
             return
         
-        # Проверка, не продан ли уже товар
-        if product.status in ["sold", "borrowed"]:
-            status_ru = "продан" if product.status == "sold" else "в долгу"
-            await callback.message.answer(f"❌ Товар уже {status_ru}.")
+        # Проверка остатка
+        if not product.quantity or product.quantity <= 0:
+            await callback.message.answer(f"❌ Товар «{product.name}» закончился.")
+            await callback.answer()
+            return
+        
+        # Корзина уже открыта: добавляем товар к ней
+        if await state.get_state() == SaleState.cart.state:
+            data = await state.get_data()
+            if not data.get("buyer"):
+                await _expired(callback, state)
+                return
+            cart = _cart(data)
+            if cart.get(product_id, 0) >= product.quantity:
+                await callback.answer("❌ Больше нет в наличии.")
+                return
+            cart[product_id] = cart.get(product_id, 0) + 1
+            await state.update_data(cart=_pack(cart))
+            text, keyboard = await _render_cart(session, data["buyer"], cart)
+            await callback.message.answer(text, reply_markup=keyboard)
             await callback.answer()
             return
     
@@ -39,56 +61,41 @@ async def buyer_name(message: Message, state: FSMContext):
         await message.answer("❌ Имя покупателя не может быть пустым. Введите имя:")
         return
     
-    await state.update_data(buyer=buyer)
-    
     data = await state.get_data()
     product_id = data.get("product_id")
     
-    with SessionLocal() as session:
-        product = session.query(Product).filter_by(id=product_id).first()
+    async with AsyncSessionLocal() as session:
+        product = await session.get(Product, product_id)
         if not product:
             await message.answer("❌ Товар не найден. Пожалуйста, начните заново.")
             await state.clear()
             return
         
-        await message.answer(
-            f"🛍️ Продажа: {product.name}\n"
-            f"💰 Цена: {product.price:.2f}\n"
-            f"👤 Покупатель: {buyer}\n\n"
-            f"Статус оплаты?",
-            reply_markup=payment_type_kb(product_id)
-        )
+        # Открываем корзину с одной единицей товара
+        cart = {product_id: 1}
+        await state.update_data(buyer=buyer, cart=_pack(cart))
+        await state.set_state(SaleState.cart)
+        
+        text, keyboard = await _render_cart(session, buyer, cart)
+        await message.answer(text, reply_markup=keyboard)
 
+# Кнопки «Оплачено» / «В долг» в сообщениях, отправленных до появления корзины
 @router.callback_query(F.data.startswith("clear:"))
 async def money_clear(callback: CallbackQuery, state: FSMContext):
     product_id = int(callback.data.split(":")[1])
     data = await state.get_data()
+    if not data.get("buyer"):
+        await _expired(callback, state)
+        return
     
-    with SessionLocal() as session:
-        product = session.query(Product).filter_by(id=product_id).first()
-        if not product:
-            await callback.message.answer("❌ Товар не найден.")
-            await callback.answer()
+    async with AsyncSessionLocal() as session:
+        # Продажа одной транзакцией: списание, запись о продаже, сводка
+        recorded = await record_cleared_sale(session, product_id, data["buyer"])
+        if not recorded:
+            await _not_available(callback, session, product_id)
             return
-        
-        # Создание записи о продаже
-        sale = Sale(
-            product_id=product.id,
-            buyer_name=data["buyer"],
-            price=product.price,
-            is_cleared=True,
-            payment_type="pending"  # Будет обновлено позже
-        )
-        session.add(sale)
-        session.commit()
-        session.refresh(sale)
-        
-        # Обновление статуса товара
-        product.status = "sold"
-        product.quantity -= 1  # Уменьшаем количество на 1
-        
-        session.commit()
     
+    product, sale = recorded
     await callback.message.answer(
         f"✅ Оплачено: {product.price:.2f}\n"
         f"👤 Покупатель: {data['buyer']}\n"
@@ -103,41 +110,18 @@ async def money_clear(callback: CallbackQuery, state: FSMContext):
 async def borrowed(callback: CallbackQuery, state: FSMContext):
     product_id = int(callback.data.split(":")[1])
     data = await state.get_data()
+    if not data.get("buyer"):
+        await _expired(callback, state)
+        return
     
-    with SessionLocal() as session:
-        product = session.query(Product).filter_by(id=product_id).first()
-        if not product:
-            await callback.message.answer("❌ Товар не найден.")
-            await callback.answer()
+    async with AsyncSessionLocal() as session:
+        # Продажа в долг одной транзакцией: списание, продажа и долг
+        recorded = await record_credit_sale(session, product_id, data["buyer"])
+        if not recorded:
+            await _not_available(callback, session, product_id)
             return
-        
-        # Создание записи о продаже (в долг)
-        sale = Sale(
-            product_id=product.id,
-            buyer_name=data["buyer"],
-            price=product.price,
-            is_cleared=False,
-            payment_type="borrowed"
-        )
-        session.add(sale)
-        session.commit()
-        session.refresh(sale)
-        
-        # Создание записи о долге
-        debt = Debt(
-            sale_id=sale.id,
-            total_amount=product.price,
-            paid_amount=0,
-            is_settled=False
-        )
-        session.add(debt)
-        
-        # Обновление статуса товара
-        product.status = "borrowed"
-        product.quantity -= 1
-        
-        session.commit()
     
+    product, sale = recorded
     await callback.message.answer(
         f"📝 Отмечено как долг:\n"
         f"👤 Покупатель: {data['buyer']}\n"
@@ -148,6 +132,21 @@ async def borrowed(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     await callback.answer()
 
+# Данные продажи в FSM устарели (истек срок хранения) или уже очищены
+async def _expired(callback: CallbackQuery, state: FSMContext):
+    await state.clear()
+    await callback.message.answer("❌ Данные продажи устарели. Пожалуйста, начните заново.")
+    await callback.answer()
+
+# Товар удален или закончился (в том числе продан другим продавцом только что)
+async def _not_available(callback: CallbackQuery, session, product_id: int):
+    product = await session.get(Product, product_id)
+    if not product:
+        await callback.message.answer("❌ Товар не найден.")
+    else:
+        await callback.message.answer(f"❌ Товар «{product.name}» закончился.")
+    await callback.answer()
+
 @router.callback_query(F.data.startswith(("cash:", "card:")))
 async def set_payment(callback: CallbackQuery):
     parts = callback.data.split(":")
@@ -156,25 +155,143 @@ async def set_payment(callback: CallbackQuery):
     
     pay_type_ru = "НАЛИЧНЫЕ" if pay_type == "cash" else "КАРТА"
     
-    with SessionLocal() as session:
-        sale = session.query(Sale).filter_by(id=sale_id).first()
+    async with AsyncSessionLocal() as session:
+        sale = await session.get(Sale, sale_id)
         if not sale:
             await callback.message.answer("❌ Запись о продаже не найдена.")
             await callback.answer()
             return
         
+        # Перенос продажи в сводке на новый тип оплаты
+        if sale.is_cleared:
+            await remove_sale(session, sale)
         sale.payment_type = pay_type
-        session.commit()
-        
-        product = session.query(Product).filter_by(id=sale.product_id).first()
+        if sale.is_cleared:
+            await add_sale(session, sale)
+        await session.commit()
         
         await callback.message.answer(
             f"✅ Продажа завершена!\n"
-            f"📦 Товар: {product.name if product else 'Н/Д'}\n"
+            f"📦 Товар: {sale.product_name or 'Н/Д'}\n"
             f"👤 Покупатель: {sale.buyer_name}\n"
             f"💰 Сумма: {sale.price:.2f}\n"
             f"💳 Оплата: {pay_type_ru}\n"
             f"📅 Дата: {sale.created_at.strftime('%Y-%m-%d %H:%M') if sale.created_at else 'Сейчас'}"
         )
     
-    await callback.answer()
\ No newline at end of file
+    await callback.answer()
+
+# Корзина хранится в FSM как список [product_id, количество]
+def _cart(data):
+    return {product_id: quantity for product_id, quantity in data.get("cart", [])}
+
+def _pack(cart):
+    return [[product_id, quantity] for product_id, quantity in cart.items()]
+
+async def _render_cart(session, buyer, cart):
+    products = {
+        p.id: p for p in (await session.scalars(
+            select(Product).where(Product.id.in_(list(cart)))
+        )).all()
+    }
+    lines = [(products[pid], quantity) for pid, quantity in cart.items() if pid in products]
+    total = sum(product.price * quantity for product, quantity in lines)
+    
+    text = f"🛒 Корзина — 👤 {buyer}\n\n"
+    for product, quantity in lines:
+        text += f"• {product.name}: {quantity} × {product.price:.2f} = {product.price * quantity:.2f} (в наличии {product.quantity})\n"
+    text += f"\n💰 Итого: {total:.2f}\n\nКоличество: ➖/➕. Способ оплаты?"
+    return text, cart_kb(lines)
+
+# Изменение количества в корзине
+@router.callback_query(SaleState.cart, F.data.startswith(("cart_inc:", "cart_dec:")))
+async def change_cart_quantity(callback: CallbackQuery, state: FSMContext):
+    action, product_id = callback.data.split(":")
+    product_id = int(product_id)
+    data = await state.get_data()
+    if not data.get("buyer"):
+        await _expired(callback, state)
+        return
+    cart = _cart(data)
+    
+    async with AsyncSessionLocal() as session:
+        if action == "cart_inc":
+            product = await session.get(Product, product_id)
+            if not product or cart.get(product_id, 0) >= (product.quantity or 0):
+                await callback.answer("❌ Больше нет в наличии.")
+                return
+            cart[product_id] = cart.get(product_id, 0) + 1
+        elif cart.get(product_id, 0) > 1:
+            cart[product_id] -= 1
+        else:
+            cart.pop(product_id, None)
+        
+        await state.update_data(cart=_pack(cart))
+        if not cart:
+            await callback.message.edit_text("🛒 Корзина пуста. Выберите товар в «📦 Все товары».")
+            await callback.answer()
+            return
+        
+        text, keyboard = await _render_cart(session, data["buyer"], cart)
+    
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+# Добавление другого товара в корзину
+@router.callback_query(SaleState.cart, F.data == "cart_more")
+async def cart_more(callback: CallbackQuery, shop_ids=()):
+    async with AsyncSessionLocal() as session:
+        products, has_prev, has_next = await product_page(session, shop_ids)
+    
+    await callback.message.answer(
+        "Выберите товар для корзины:",
+        reply_markup=product_page_kb(products, has_prev, has_next)
+    )
+    await callback.answer()
+
+# Отмена корзины
+@router.callback_query(F.data == "cart_cancel")
+async def cart_cancel(callback: CallbackQuery, state: FSMContext):
+    await state.clear()
+    await callback.message.edit_text("❌ Продажа отменена.")
+    await callback.answer()
+
+# Оформление корзины: одна транзакция на все позиции
+@router.callback_query(SaleState.cart, F.data.startswith("checkout:"))
+async def checkout(callback: CallbackQuery, state: FSMContext):
+    payment_type = callback.data.split(":")[1]  # "cash", "card" или "borrowed"
+    data = await state.get_data()
+    if not data.get("buyer"):
+        await _expired(callback, state)
+        return
+    cart = _cart(data)
+    if not cart:
+        await callback.answer("🛒 Корзина пуста.")
+        return
+    
+    async with AsyncSessionLocal() as session:
+        try:
+            lines = await record_sale(session, data["buyer"], list(cart.items()), payment_type)
+        except OutOfStock as e:
+            product = await session.get(Product, e.product_id)
+            name = product.name if product else e.product_id
+            await callback.message.answer(f"❌ Недостаточно товара «{name}». Измените количество.")
+            if product:
+                text, keyboard = await _render_cart(session, data["buyer"], cart)
+                await callback.message.edit_text(text, reply_markup=keyboard)
+            await callback.answer()
+            return
+    
+    total = sum(sale.price for _, sale in lines)
+    if payment_type == "borrowed":
+        text = f"📝 Отмечено как долг:\n👤 Покупатель: {data['buyer']}\n"
+    else:
+        pay_type_ru = "НАЛИЧНЫЕ" if payment_type == "cash" else "КАРТА"
+        text = f"✅ Продажа завершена!\n👤 Покупатель: {data['buyer']}\n💳 Оплата: {pay_type_ru}\n"
+    for product, sale in lines:
+        text += f"📦 {product.name} × {sale.quantity} — {sale.price:.2f}\n"
+    text += f"💰 Сумма: {total:.2f}"
+    
+    await callback.message.edit_text(text)
+    await state.clear()
+    await callback.answer()
@@ -418,8 +418,10 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database import SessionLocal
+from sqlalchemy import select, func
+from database import AsyncSessionLocal
 from models import User, Shop, Payment
+from money import to_money
 from datetime import datetime, timedelta
 import asyncio
 
@@ -452,17 +454,17 @@ async def settings_menu(message: Message):
 
 # Информация о профиле
 @router.callback_query(F.data == "settings_profile")
-async def show_profile(callback: CallbackQuery):
-    with SessionLocal() as session:
-        user = session.query(User).filter_by(telegram_id=callback.from_user.id).first()
+async def show_profile(callback: CallbackQuery, profile=None):
+    async with AsyncSessionLocal() as session:
+        user = profile
         
         if not user:
             await callback.message.answer("❌ Пользователь не найден. Пожалуйста, сначала запустите /start")
             await callback.answer()
             return
         
-        # Получаем магазины пользователя
-        shops = session.query(Shop).filter_by(owner_id=user.id).all()
+        # Магазины пользователя (из кэша профилей)
+        shops = user.shops
         
         profile_text = (
             f"👤 Ваш профиль\n"
@@ -476,19 +478,23 @@ async def show_profile(callback: CallbackQuery):
         
         if shops:
             profile_text += f"🏪 Ваши магазины ({len(shops)}):\n"
+            # Статистика всех магазинов двумя запросами (продажа хранит свой магазин)
+            from models import Product, Sale
+            shop_ids = [shop.id for shop in shops]
+            products_counts = dict((await session.execute(
+                select(Product.shop_id, func.count(Product.id))
+                .where(Product.shop_id.in_(shop_ids))
+                .group_by(Product.shop_id)
+            )).all())
+            sales_counts = dict((await session.execute(
+                select(Sale.shop_id, func.count(Sale.id))
+                .where(Sale.shop_id.in_(shop_ids))
+                .group_by(Sale.shop_id)
+            )).all())
             for shop in shops:
-                # Получаем статистику магазина
-                from models import Product, Sale
-                products_count = session.query(Product).filter_by(shop_id=shop.id).count()
-                sales_count = session.query(Sale).filter(
-                    Sale.product_id.in_(
-                        session.query(Product.id).filter_by(shop_id=shop.id)
-                    )
-                ).count()
-                
                 profile_text += (
                     f"• Магазин №{shop.shop_number} - {shop.location}\n"
-                    f"  📦 Товаров: {products_count} | 🛒 Продаж: {sales_count}\n"
+                    f"  📦 Товаров: {products_counts.get(shop.id, 0)} | 🛒 Продаж: {sales_counts.get(shop.id, 0)}\n"
                 )
         else:
             profile_text += "🏪 Магазины пока отсутствуют. Используйте /start чтобы создать магазин.\n"
@@ -515,9 +521,9 @@ async def edit_profile(callback: CallbackQuery):
 
 # Статус оплаты и подписка
 @router.callback_query(F.data == "settings_payment")
-async def payment_status(callback: CallbackQuery):
-    with SessionLocal() as session:
-        user = session.query(User).filter_by(telegram_id=callback.from_user.id).first()
+async def payment_status(callback: CallbackQuery, profile=None):
+    async with AsyncSessionLocal() as session:
+        user = profile
         
         if not user:
             await callback.message.answer("❌ Пользователь не найден.")
@@ -525,7 +531,7 @@ async def payment_status(callback: CallbackQuery):
             return
         
         # Получаем последний платеж
-        payment = session.query(Payment).filter_by(user_id=user.id).order_by(Payment.created_at.desc()).first()
+        payment = await session.scalar(select(Payment).filter_by(user_id=user.id).order_by(Payment.created_at.desc()).limit(1))
         
         if payment and payment.expires_at > datetime.now():
             # Активная подписка
@@ -626,7 +632,7 @@ async def select_plan(callback: CallbackQuery, state: FSMContext):
 
 # Подтверждение оплаты пользователем
 @router.callback_query(F.data == "confirm_payment")
-async def confirm_payment(callback: CallbackQuery, state: FSMContext):
+async def confirm_payment(callback: CallbackQuery, state: FSMContext, profile=None):
     data = await state.get_data()
     
     if not data:
@@ -639,8 +645,8 @@ async def confirm_payment(callback: CallbackQuery, state: FSMContext):
     price = data.get('selected_price', 0)
     days = data.get('selected_days', 30)
     
-    with SessionLocal() as session:
-        user = session.query(User).filter_by(telegram_id=callback.from_user.id).first()
+    async with AsyncSessionLocal() as session:
+        user = profile
         
         if not user:
             await callback.message.answer("❌ Пользователь не найден.")
@@ -651,13 +657,13 @@ async def confirm_payment(callback: CallbackQuery, state: FSMContext):
         # Создаем запись о платеже со статусом "ожидает подтверждения"
         payment = Payment(
             user_id=user.id,
-            amount=price,
+            amount=to_money(price),
             plan_type=plan_name,
             status="pending",  # Статус "ожидает подтверждения"
             expires_at=datetime.now() + timedelta(days=days)
         )
         session.add(payment)
-        session.commit()
+        await session.commit()
         payment_id = payment.id
         
         # Формируем сообщение для администратора
@@ -748,15 +754,13 @@ async def start_support_message(callback: CallbackQuery, state: FSMContext):
 
 # Обработка сообщения в поддержку
 @router.message(PaymentState.waiting_for_confirmation)
-async def send_support_message(message: Message, state: FSMContext):
+async def send_support_message(message: Message, state: FSMContext, profile=None):
     if message.text == "/cancel":
         await message.answer("❌ Сообщение отменено.")
         await state.clear()
         return
     
-    with SessionLocal() as session:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        user_name = user.name if user else "Неизвестный пользователь"
+    user_name = profile.name if profile else "Неизвестный пользователь"
     
     # Формируем сообщение для администратора
     admin_notification = (
@@ -839,12 +843,12 @@ async def faq_section(callback: CallbackQuery):
 # Раздел "О боте"
 @router.callback_query(F.data == "settings_about")
 async def about_section(callback: CallbackQuery):
-    with SessionLocal() as session:
-        user_count = session.query(User).count()
-        shop_count = session.query(Shop).count()
+    async with AsyncSessionLocal() as session:
+        user_count = await session.scalar(select(func.count(User.id)))
+        shop_count = await session.scalar(select(func.count(Shop.id)))
         from models import Product, Sale
-        product_count = session.query(Product).count()
-        sale_count = session.query(Sale).count()
+        product_count = await session.scalar(select(func.count(Product.id)))
+        sale_count = await session.scalar(select(func.count(Sale.id)))
     
     about_text = (
         "ℹ️ О боте QuickSell\n"
@@ -9,9 +9,11 @@ from aiogram.types import (
     InlineKeyboardButton, 
     CallbackQuery
 )
-from database import SessionLocal
+from sqlalchemy import select
+from database import AsyncSessionLocal
 from models import User, Shop
 from keyboards import main_menu
+from middlewares.user_context import user_cache
 
 router = Router()
 
@@ -23,44 +25,39 @@ class StartStates(StatesGroup):
 
 # Шаг 1: команда /start
 @router.message(Command("start"))
-async def start_handler(message: Message, state: FSMContext):
+async def start_handler(message: Message, state: FSMContext, profile=None):
     await state.clear()
-    db = SessionLocal()
-    try:
-        # Ищем пользователя по telegram_id
-        user = db.query(User).filter_by(telegram_id=message.from_user.id).first()
-        shop = db.query(Shop).filter_by(owner_id=user.id).first() if user else None
-
-        # Если пользователь уже зарегистрирован и имеет магазин
-        if user and user.name and shop:
-            info_text = (
-                "📋 **Ваш профиль:**\n"
-                f"👤 Имя: {user.name}\n"
-                f"📍 Расположение: {user.location}\n"
-                f"🏪 Магазин №: {shop.shop_number}\n"
-                "━━━━━━━━━━━━━━━━━━━━\n"
-                "Вы можете управлять товарами через меню ниже или изменить данные профиля."
-            )
-            
-            edit_kb = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="⚙️ Редактировать профиль", callback_data="edit_profile")]
-            ])
-            
-            # Показываем основное меню и карточку с кнопкой редактирования
-            await message.answer(info_text, reply_markup=main_menu, parse_mode="Markdown")
-            await message.answer("Хотите изменить данные?", reply_markup=edit_kb)
-            return
+    # Пользователь и его магазины (из кэша профилей)
+    user = profile
+    shop = profile.shops[0] if profile and profile.shops else None
 
-        # Если новый пользователь или профиль не завершен
-        await message.answer(
-            "👋 Добро пожаловать! Вы еще не зарегистрированы.\n"
-            "Пожалуйста, введите ваше полное имя:", 
-            reply_markup=ReplyKeyboardRemove()
+    # Если пользователь уже зарегистрирован и имеет магазин
+    if user and user.name and shop:
+        info_text = (
+            "📋 **Ваш профиль:**\n"
+            f"👤 Имя: {user.name}\n"
+            f"📍 Расположение: {user.location}\n"
+            f"🏪 Магазин №: {shop.shop_number}\n"
+            "━━━━━━━━━━━━━━━━━━━━\n"
+            "Вы можете управлять товарами через меню ниже или изменить данные профиля."
         )
-        await state.set_state(StartStates.waiting_for_name)
         
-    finally:
-        db.close()
+        edit_kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="⚙️ Редактировать профиль", callback_data="edit_profile")]
+        ])
+        
+        # Показываем основное меню и карточку с кнопкой редактирования
+        await message.answer(info_text, reply_markup=main_menu, parse_mode="Markdown")
+        await message.answer("Хотите изменить данные?", reply_markup=edit_kb)
+        return
+
+    # Если новый пользователь или профиль не завершен
+    await message.answer(
+        "👋 Добро пожаловать! Вы еще не зарегистрированы.\n"
+        "Пожалуйста, введите ваше полное имя:", 
+        reply_markup=ReplyKeyboardRemove()
+    )
+    await state.set_state(StartStates.waiting_for_name)
 
 # Обработчик кнопки "Редактировать"
 @router.callback_query(F.data == "edit_profile")
@@ -113,44 +110,41 @@ async def get_shop_number(message: Message, state: FSMContext):
     name = data.get("name")
     line = data.get("line")
     
-    db = SessionLocal()
-    try:
-        # Ищем пользователя по telegram_id (более надежно, чем по id из стейта)
-        user = db.query(User).filter_by(telegram_id=message.from_user.id).first()
-        
-        if not user:
-            user = User(telegram_id=message.from_user.id, language="ru")
-            db.add(user)
-            db.commit()
-            db.refresh(user)
+    async with AsyncSessionLocal() as db:
+        try:
+            # Ищем пользователя по telegram_id (более надежно, чем по id из стейта)
+            user = await db.scalar(select(User).filter_by(telegram_id=message.from_user.id))
+            
+            if not user:
+                user = User(telegram_id=message.from_user.id, language="ru")
+                db.add(user)
+                await db.flush()
 
-        user.name = name
-        user.location = line
-        db.commit()
+            user.name = name
+            user.location = line
 
-        existing_shop = db.query(Shop).filter_by(owner_id=user.id).first()
-        if existing_shop:
-            existing_shop.shop_number = shop_number
-            existing_shop.location = line
-        else:
-            new_shop = Shop(shop_number=shop_number, location=line, owner_id=user.id)
-            db.add(new_shop)
-        
-        db.commit()
-        
-        await message.answer(
-            f"✅ Данные успешно сохранены!\n\n"
-            f"👤 Имя: {name}\n"
-            f"🏪 Магазин №{shop_number}\n"
-            f"📍 Расположение: {line}",
-            reply_markup=main_menu
-        )
-        
-    except Exception as e:
-        print(f"Ошибка БД: {e}")
-        db.rollback()
-        await message.answer("❌ Ошибка при сохранении данных.")
-    finally:
-        db.close()
+            existing_shop = await db.scalar(select(Shop).filter_by(owner_id=user.id).limit(1))
+            if existing_shop:
+                existing_shop.shop_number = shop_number
+                existing_shop.location = line
+            else:
+                new_shop = Shop(shop_number=shop_number, location=line, owner_id=user.id)
+                db.add(new_shop)
+            
+            await db.commit()
+            user_cache.invalidate(message.from_user.id)
+            
+            await message.answer(
+                f"✅ Данные успешно сохранены!\n\n"
+                f"👤 Имя: {name}\n"
+                f"🏪 Магазин №{shop_number}\n"
+                f"📍 Расположение: {line}",
+                reply_markup=main_menu
+            )
+            
+        except Exception as e:
+            print(f"Ошибка БД: {e}")
+            await db.rollback()
+            await message.answer("❌ Ошибка при сохранении данных.")
     
     await state.clear()
\ No newline at end of file
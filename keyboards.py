@@ -29,17 +29,6 @@ def product_actions(product_id: int):
         ]
     )
 
-# Тип оплаты (Payment Type)
-def payment_type_kb(product_id: int):
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="💰 Оплачено", callback_data=f"clear:{product_id}"),
-                InlineKeyboardButton(text="🕒 В долг", callback_data=f"borrow:{product_id}")
-            ]
-        ]
-    )
-
 # Наличные или карта (Cash/Card)
 def cash_card_kb(sale_id: int):
     return InlineKeyboardMarkup(
@@ -49,4 +38,42 @@ def cash_card_kb(sale_id: int):
                 InlineKeyboardButton(text="Карта", callback_data=f"card:{sale_id}")
             ]
         ]
-    )
\ No newline at end of file
+    )
+# Страница каталога товаров (Product catalogue page)
+def product_page_kb(products, has_prev: bool, has_next: bool):
+    rows = [
+        [
+            InlineKeyboardButton(text=f"✅ {p.id}. {p.name}", callback_data=f"sold:{p.id}"),
+            InlineKeyboardButton(text="✏️", callback_data=f"edit:{p.id}"),
+            InlineKeyboardButton(text="❌", callback_data=f"delete:{p.id}")
+        ]
+        for p in products
+    ]
+
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"products_prev:{products[0].id}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"products_next:{products[-1].id}"))
+    if nav:
+        rows.append(nav)
+
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+# Корзина покупателя (Cart)
+def cart_kb(lines):
+    rows = [
+        [
+            InlineKeyboardButton(text=f"➖ {product.name}", callback_data=f"cart_dec:{product.id}"),
+            InlineKeyboardButton(text=f"➕ {product.name} ({quantity})", callback_data=f"cart_inc:{product.id}")
+        ]
+        for product, quantity in lines
+    ]
+    rows.append([InlineKeyboardButton(text="🛒 Добавить товар", callback_data="cart_more")])
+    rows.append([
+        InlineKeyboardButton(text="💵 Наличные", callback_data="checkout:cash"),
+        InlineKeyboardButton(text="💳 Карта", callback_data="checkout:card"),
+        InlineKeyboardButton(text="🕒 В долг", callback_data="checkout:borrowed")
+    ])
+    rows.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cart_cancel")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
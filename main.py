@@ -36,22 +36,64 @@
 #!----------------
 
 import asyncio
+import hmac
 import os
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
 from aiogram import Bot, Dispatcher, types
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import BOT_TOKEN
-from database import init_db
+from config import (
+    BOT_TOKEN,
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_SECRET,
+    WEBHOOK_WORKERS,
+    WEBHOOK_QUEUE_SIZE,
+    HEALTH_DB_TIMEOUT,
+)
+from database import init_db, engine, pool_status, ping
+from fsm_storage import build_storage, DatabaseStorage
+from update_queue import UpdateQueue, QueueFull
+from outbound import OutboundSender
+from middlewares.user_context import UserContextMiddleware
+import metrics
+from services import snapshot_service
+from services.report_cache import report_cache
 from handlers import start, products, sales, debts, reports, settings
 import uvicorn
 
 # Global variables to store bot instances
 bot = None
 dp = None
+update_queue = None
+outbound = None
+
+def build_dispatcher(storage):
+    """Dispatcher with the bot's middlewares and routers (also used by bench.py)."""
+    dp = Dispatcher(storage=storage)
+    
+    # Count and time every handler (see /stats and /metrics)
+    dp.message.middleware(metrics.MetricsMiddleware())
+    dp.callback_query.middleware(metrics.MetricsMiddleware())
+    
+    # Resolve the caller's profile (cached) for handlers that need it
+    dp.message.middleware(UserContextMiddleware())
+    dp.callback_query.middleware(UserContextMiddleware())
+    
+    # Register routers
+    dp.include_router(start.router)
+    dp.include_router(products.router)
+    dp.include_router(sales.router)
+    dp.include_router(debts.router)
+    dp.include_router(reports.router)
+    dp.include_router(settings.router)
+    
+    return dp
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -59,13 +101,13 @@ async def lifespan(app: FastAPI):
     Lifespan manager for FastAPI application.
     Handles startup and shutdown events.
     """
-    global bot, dp
+    global bot, dp, update_queue, outbound
     
     print("🚀 Starting Bot System...")
     
-    # Initialize database (sync)
+    # Initialize database (async)
     print("🔹 Initializing database...")
-    init_db()
+    await init_db()
     print("✅ Database initialized.")
     
     # Initialize bot with default properties
@@ -74,23 +116,42 @@ async def lifespan(app: FastAPI):
         token=BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    dp = Dispatcher()
+    # Every outgoing message goes through the rate-limited sender
+    outbound = OutboundSender()
+    bot.session.middleware(outbound)
+    storage = build_storage()
+    dp = build_dispatcher(storage)
     
-    # Register routers
-    dp.include_router(start.router)
-    dp.include_router(products.router)
-    dp.include_router(sales.router)
-    dp.include_router(debts.router)
-    dp.include_router(reports.router)
-    dp.include_router(settings.router)
+    # Expire abandoned flows kept in the database
+    purge_task = None
+    if isinstance(storage, DatabaseStorage):
+        purge_task = asyncio.create_task(storage.purge_periodically())
     
-    print("✅ Handlers registered.")
+    # Nightly report snapshots (and pushed day/week summaries)
+    snapshot_task = asyncio.create_task(snapshot_service.run_periodically(bot))
     
-    # Start bot polling (non-blocking)
-    print("🔹 Starting bot polling...")
+    print("✅ Handlers registered.")
     
-    # Create a task for bot polling
-    polling_task = asyncio.create_task(dp.start_polling(bot))
+    polling_task = None
+    if BOT_MODE == "webhook":
+        # Updates arrive on /webhook and are processed by background workers
+        print("🔹 Starting webhook workers...")
+        update_queue = UpdateQueue(dp, bot, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE)
+        update_queue.start()
+        
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                url=f"{WEBHOOK_URL.rstrip('/')}/webhook",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+            print(f"✅ Webhook set to {WEBHOOK_URL.rstrip('/')}/webhook")
+    else:
+        # Start bot polling (non-blocking)
+        print("🔹 Starting bot polling...")
+        
+        # Create a task for bot polling
+        polling_task = asyncio.create_task(dp.start_polling(bot))
     
     print("✅ Bot is now running via FastAPI.")
     print("🌐 Web server is available at http://0.0.0.0:8000")
@@ -108,10 +169,25 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             pass
     
-    # Close bot session
+    # Finish queued webhook updates
+    if update_queue:
+        await update_queue.stop()
+    
+    # Stop background jobs and release storage
+    snapshot_task.cancel()
+    if purge_task:
+        purge_task.cancel()
+    await storage.close()
+    
+    # Deliver queued replies, then close bot session
+    if outbound:
+        await outbound.close()
     if bot:
         await bot.session.close()
     
+    # Close database connections
+    await engine.dispose()
+    
     print("✅ System stopped.")
 
 # Create FastAPI app with lifespan
@@ -133,38 +209,89 @@ async def root():
     }
 
 @api.get("/health")
-async def health_check():
-    """Health check endpoint."""
+async def health_check(response: Response):
+    """Health check endpoint: a real SELECT 1 through the connection pool."""
+    try:
+        await ping(HEALTH_DB_TIMEOUT)
+        database = "ok"
+    except Exception as e:
+        database = f"error: {type(e).__name__}"
+        response.status_code = 503
+    
     return {
-        "status": "healthy",
-        "database": "initialized",
+        "status": "healthy" if database == "ok" else "unhealthy",
+        "database": database,
         "bot": "running" if bot else "stopped"
     }
 
+async def _gauges():
+    """Point-in-time values: (name, help, value) for pool, queues and FSM sessions."""
+    pool = pool_status()
+    fsm_sessions = None
+    if isinstance(dp and dp.storage, DatabaseStorage):
+        try:
+            fsm_sessions = await dp.storage.active_count()
+        except Exception as e:
+            # Database down: report the rest, skip this gauge
+            print(f"Error counting FSM sessions: {e}")
+    elif isinstance(dp and dp.storage, MemoryStorage):
+        fsm_sessions = len(dp.storage.storage)
+    
+    return [
+        ("db_pool_size", "Connections kept in the pool.", pool.get("size")),
+        ("db_pool_checked_out", "Connections in use.", pool.get("checked_out")),
+        ("db_pool_overflow", "Connections opened above the pool size.", pool.get("overflow")),
+        ("db_pool_wait_avg_ms", "Average wait for a pooled connection.", pool.get("wait_avg_ms")),
+        ("db_connects", "Physical connections opened since start.", pool["connects"]),
+        ("fsm_active_sessions", "Unexpired FSM flows.", fsm_sessions),
+        ("outbound_queue_depth", "Outgoing requests waiting to be sent.", outbound.depth() if outbound else None),
+        ("webhook_queue_depth", "Webhook updates waiting for a worker.", update_queue.depth() if update_queue else None),
+    ]
+
 @api.get("/stats")
 async def get_stats():
-    """Get bot statistics (placeholder - you can add real stats)."""
+    """Bot statistics: handler counters and latencies, database and queues."""
     return {
-        "bot_status": "active",
-        "service": "QuickSell Inventory Management",
-        "features": [
-            "Product Management",
-            "Sales Tracking",
-            "Debt Management",
-            "Advanced Reporting",
-            "Multi-Shop Support"
-        ]
+        "bot_status": "active" if bot else "stopped",
+        "gauges": {name: value for name, _, value in await _gauges()},
+        "metrics": metrics.snapshot(),
+        "outbound": outbound.stats() if outbound else None,
+        "webhook": update_queue.stats() if update_queue else None,
+        "report_cache": report_cache.stats()
     }
 
-# Webhook endpoint (optional - if you want to use webhooks instead of polling)
+@api.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of the same data."""
+    return PlainTextResponse(metrics.render(await _gauges()), media_type="text/plain; version=0.0.4")
+
+# Webhook endpoint (BOT_MODE=webhook)
 @api.post("/webhook")
-async def webhook(update: dict):
+async def webhook(request: Request):
     """
     Webhook endpoint for receiving Telegram updates.
-    Note: You need to configure webhook with Telegram API.
+    The update is validated and queued; handlers run in the background,
+    so Telegram gets its answer without waiting for them.
     """
-    telegram_update = types.Update(**update)
-    await dp.feed_update(bot=bot, update=telegram_update)
+    if update_queue is None:
+        return Response(status_code=409, content="Webhook mode is disabled")
+    
+    if WEBHOOK_SECRET:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token, WEBHOOK_SECRET):
+            return Response(status_code=403)
+    
+    try:
+        telegram_update = types.Update.model_validate(await request.json(), context={"bot": bot})
+    except ValueError:  # malformed JSON or not an Update
+        return Response(status_code=400)
+    
+    try:
+        update_queue.enqueue(telegram_update)
+    except QueueFull:
+        # Telegram retries the delivery later
+        return Response(status_code=503)
+    
     return {"status": "ok"}
 
 # Admin API endpoints (optional - for managing bot via REST API)
@@ -174,7 +301,9 @@ async def admin_status():
     return {
         "bot_token_set": bool(BOT_TOKEN),
         "bot_instance": "initialized" if bot else "not initialized",
-        "dispatcher": "initialized" if dp else "not initialized"
+        "dispatcher": "initialized" if dp else "not initialized",
+        "database_pool": pool_status(),
+        "outbound": outbound.stats() if outbound else None
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,47 @@
+import argparse
+import asyncio
+
+from database import init_db, engine, AsyncSessionLocal
+from services import rollup_service, snapshot_service
+
+
+async def migrate():
+    print("🔹 Creating tables and applying migrations...")
+    await init_db()
+    print("✅ Database is up to date.")
+
+
+async def rebuild_rollup():
+    print("🔹 Rebuilding daily_sales_rollup from sales...")
+    async with AsyncSessionLocal() as session:
+        rows = await rollup_service.rebuild(session)
+        await session.commit()
+    print(f"✅ {rows} rollup rows written.")
+
+
+async def take_snapshots():
+    print("🔹 Taking report snapshots up to midnight...")
+    async with AsyncSessionLocal() as session:
+        stored = await snapshot_service.take_snapshots(session, push=False)
+    print(f"✅ Analytics snapshots and {stored} day/week summaries stored.")
+
+
+COMMANDS = {
+    "migrate": migrate,
+    "rebuild-rollup": rebuild_rollup,
+    "take-snapshots": take_snapshots,
+}
+
+
+async def main(command):
+    try:
+        await COMMANDS[command]()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QuickSell maintenance commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+    asyncio.run(main(args.command))
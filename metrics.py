@@ -0,0 +1,243 @@
+"""
+In-process operational metrics.
+
+Counters and histograms are plain dicts updated in place: no locks are
+needed inside one event loop and recording costs a few dictionary
+operations. MetricsMiddleware times every handler and counts and times its
+SQL statements per route (via cursor execute hooks on the engine); main.py
+exposes the values as JSON on /stats and in the Prometheus text format on
+/metrics.
+
+The same middleware is the slow-update profiler: an update whose handler
+time, statement count or slowest statement crosses the SLOW_* thresholds
+is logged with its route and callback data, which is how N+1 loops show
+up. With PROFILE_DEBUG the stats are also sent to the chat after the reply.
+"""
+import time
+from contextvars import ContextVar
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+from sqlalchemy import event
+
+from config import SLOW_UPDATE_MS, SLOW_UPDATE_QUERIES, SLOW_QUERY_MS, PROFILE_DEBUG
+from database import engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, labels
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        return {":".join(key) or "total": value for key, value in self.values.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self.values = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def snapshot(self):
+        return {
+            ":".join(key) or "total": {
+                "count": series[-1],
+                "avg": round(series[-2] / series[-1], 4) if series[-1] else 0,
+            }
+            for key, series in self.values.items()
+        }
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (str(bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+UPDATES = Counter("bot_updates_total", "Updates handled, by router and handler.", ("router", "handler"))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handlers that raised, by route.", ("route",))
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Handler latency by callback prefix or message handler.", ("route",)
+)
+UPDATE_QUERIES = Histogram(
+    "bot_update_db_queries", "SQL statements per handled update.", ("route",), QUERY_BUCKETS
+)
+UPDATE_DB_SECONDS = Histogram(
+    "bot_update_db_seconds", "Time spent in SQL per handled update.", ("route",)
+)
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed.")
+DB_SECONDS = Counter("db_query_seconds_total", "Time spent executing SQL statements.")
+
+REGISTRY = (
+    UPDATES, HANDLER_ERRORS, HANDLER_SECONDS, UPDATE_QUERIES, UPDATE_DB_SECONDS, DB_QUERIES, DB_SECONDS
+)
+
+STATEMENT_PREVIEW = 200  # characters of the slowest statement kept for the log
+
+
+class UpdateProfile:
+    """SQL done while handling one update."""
+    __slots__ = ("statements", "seconds", "slowest", "slowest_statement")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+        self.slowest_statement = None
+
+    def add(self, statement, elapsed):
+        self.statements += 1
+        self.seconds += elapsed
+        if elapsed > self.slowest:
+            self.slowest = elapsed
+            self.slowest_statement = statement
+
+
+# Profile of the update being handled, set by MetricsMiddleware
+_update_profile = ContextVar("update_profile", default=None)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    DB_QUERIES.inc()
+    DB_SECONDS.inc(amount=elapsed)
+
+    profile = _update_profile.get()
+    if profile is not None:
+        profile.add(statement, elapsed)
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+
+
+def route_of(event, handler):
+    """Callback prefix ("sold", "report_today"...) or the message handler's name."""
+    if isinstance(event, CallbackQuery) and event.data:
+        return event.data.split(":")[0]
+    return handler.callback.__name__
+
+
+def is_slow(profile, elapsed):
+    return (
+        elapsed * 1000 >= SLOW_UPDATE_MS
+        or profile.statements >= SLOW_UPDATE_QUERIES
+        or profile.slowest * 1000 >= SLOW_QUERY_MS
+    )
+
+
+def describe(profile, elapsed):
+    return (
+        f"{profile.statements} SQL, {profile.seconds * 1000:.1f} ms in DB, "
+        f"{elapsed * 1000:.1f} ms total, slowest {profile.slowest * 1000:.1f} ms"
+    )
+
+
+def log_slow(event, route, profile, elapsed):
+    details = f" data={event.data!r}" if isinstance(event, CallbackQuery) else ""
+    print(f"🐢 Slow update [{route}]{details}: {describe(profile, elapsed)}")
+    if profile.slowest_statement:
+        statement = " ".join(profile.slowest_statement.split())
+        print(f"   slowest: {statement[:STATEMENT_PREVIEW]}")
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Counts, times and profiles the SQL of every handled message and callback."""
+
+    def __init__(self, debug=PROFILE_DEBUG):
+        self.debug = debug
+
+    async def __call__(self, handler, event, data):
+        handler_object = data["handler"]
+        route = route_of(event, handler_object)
+        router = handler_object.callback.__module__.rsplit(".", 1)[-1]
+
+        profile = UpdateProfile()
+        token = _update_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(route)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _update_profile.reset(token)
+            HANDLER_SECONDS.observe(elapsed, route)
+            UPDATE_QUERIES.observe(profile.statements, route)
+            UPDATE_DB_SECONDS.observe(profile.seconds, route)
+            UPDATES.inc(router, handler_object.callback.__name__)
+
+            if is_slow(profile, elapsed):
+                log_slow(event, route, profile, elapsed)
+            if self.debug:
+                await self._send_debug(data, route, profile, elapsed)
+
+    async def _send_debug(self, data, route, profile, elapsed):
+        chat = data.get("event_chat")
+        if chat is None:
+            return
+        try:
+            await data["bot"].send_message(chat.id, f"🛠 {route}: {describe(profile, elapsed)}", parse_mode=None)
+        except Exception as e:
+            print(f"Error sending profile stats: {e}")
+
+
+def snapshot():
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+def render(gauges=()):
+    """Prometheus text format; `gauges` adds (name, help, value) samples."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for name, help, value in gauges:
+        if value is None:
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {float(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,129 @@
+"""
+Registered user and shops, resolved once per update and cached.
+
+Almost every handler starts by looking up the caller's User row and then
+their shops. UserContextMiddleware does that for handlers that declare a
+`profile` argument, serving it from a small LRU cache with a TTL. Handlers
+that only scope their queries to the caller's shops declare `shop_ids`
+instead (an empty list for unregistered users). The cache
+lives in one process: writes in this process invalidate their entry, and
+the TTL bounds how stale another replica's copy can get.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+
+from aiogram import BaseMiddleware
+from sqlalchemy import select
+
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+from database import AsyncSessionLocal
+from models import User, Shop
+
+
+@dataclass(frozen=True)
+class CachedShop:
+    id: int
+    shop_number: int
+    location: str
+
+
+@dataclass(frozen=True)
+class Profile:
+    id: int
+    telegram_id: int
+    name: Optional[str]
+    location: Optional[str]
+    language: Optional[str]
+    created_at: Optional[datetime]
+    shops: Tuple[CachedShop, ...]
+
+    @property
+    def shop_ids(self):
+        return [shop.id for shop in self.shops]
+
+
+class UserCache:
+    """LRU + TTL cache: Telegram ID -> Profile (or None for unknown users)."""
+
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id):
+        """Returns (found, profile)."""
+        entry = self._entries.get(telegram_id)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(telegram_id)
+        self.hits += 1
+        return True, entry[1]
+
+    def set(self, telegram_id, profile):
+        self._entries[telegram_id] = (time.monotonic() + self.ttl, profile)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id):
+        self._entries.pop(telegram_id, None)
+
+    async def resolve(self, telegram_id):
+        found, profile = self.get(telegram_id)
+        if not found:
+            profile = await load_profile(telegram_id)
+            self.set(telegram_id, profile)
+        return profile
+
+
+async def load_profile(telegram_id):
+    """User and shops in one round-trip (users LEFT JOIN shops)."""
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(User, Shop)
+            .outerjoin(Shop, Shop.owner_id == User.id)
+            .where(User.telegram_id == telegram_id)
+            .order_by(Shop.id)
+        )).all()
+
+    if not rows:
+        return None
+
+    user = rows[0][0]
+    return Profile(
+        id=user.id,
+        telegram_id=user.telegram_id,
+        name=user.name,
+        location=user.location,
+        language=user.language,
+        created_at=user.created_at,
+        shops=tuple(
+            CachedShop(id=shop.id, shop_number=shop.shop_number, location=shop.location)
+            for _, shop in rows if shop is not None
+        ),
+    )
+
+
+user_cache = UserCache()
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """Injects `profile` and `shop_ids` into handlers that ask for them."""
+
+    def __init__(self, cache=user_cache):
+        self.cache = cache
+
+    async def __call__(self, handler, event, data):
+        from_user = data.get("event_from_user")
+        params = data["handler"].params
+        if from_user and ("profile" in params or "shop_ids" in params):
+            profile = await self.cache.resolve(from_user.id)
+            data["profile"] = profile
+            data["shop_ids"] = profile.shop_ids if profile else []
+        return await handler(event, data)
@@ -0,0 +1,141 @@
+"""
+Schema migrations for databases created before a change in models.py.
+
+init_db() only creates missing tables, it never alters existing ones. Each
+entry below brings an existing PostgreSQL database in line with the models
+and is recorded in schema_migrations, so it runs exactly once. Fresh
+databases already get everything from create_all(); the statements are
+written to be no-ops there.
+"""
+from sqlalchemy import text
+
+
+def _add_foreign_key(table, column, target, on_delete=None):
+    # NOT VALID: enforce for new rows without scanning (or failing on) old ones
+    action = f" ON DELETE {on_delete}" if on_delete else ""
+    return f"""
+        DO $$ BEGIN
+            ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_fkey
+                FOREIGN KEY ({column}) REFERENCES {target}{action} NOT VALID;
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$
+    """
+
+
+def _to_money(table, *columns):
+    # Same type as money.Money; float values are rounded to cents once
+    return f"ALTER TABLE {table} " + ", ".join(
+        f"ALTER COLUMN {column} TYPE NUMERIC(12, 2) USING round({column}::numeric, 2)"
+        for column in columns
+    )
+
+
+MIGRATIONS = [
+    (1, "indexes and foreign keys on lookup columns", [
+        _add_foreign_key("products", "shop_id", "shops (id)"),
+        _add_foreign_key("sales", "product_id", "products (id)", "SET NULL"),
+        _add_foreign_key("debts", "sale_id", "sales (id)", "SET NULL"),
+        "CREATE INDEX IF NOT EXISTS ix_shops_owner_id ON shops (owner_id)",
+        "CREATE INDEX IF NOT EXISTS ix_products_shop_id_id ON products (shop_id, id)",
+        "CREATE INDEX IF NOT EXISTS ix_sales_product_id ON sales (product_id)",
+        "CREATE INDEX IF NOT EXISTS ix_sales_is_cleared_created_at ON sales (is_cleared, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_debts_sale_id ON debts (sale_id)",
+        "CREATE INDEX IF NOT EXISTS ix_debts_open_created_at ON debts (created_at) WHERE NOT is_settled",
+        "CREATE INDEX IF NOT EXISTS ix_payments_user_id_created_at ON payments (user_id, created_at DESC)",
+    ]),
+    (2, "backfill daily_sales_rollup", [
+        # Same aggregation as services.rollup_service.rebuild()
+        """
+        INSERT INTO daily_sales_rollup (shop_id, day, payment_type, product_id, sale_count, revenue)
+        SELECT coalesce(p.shop_id, 0), date(s.created_at), coalesce(s.payment_type, ''),
+               coalesce(s.product_id, 0), count(s.id), coalesce(sum(s.price), 0)
+        FROM sales s LEFT OUTER JOIN products p ON p.id = s.product_id
+        WHERE s.is_cleared AND s.created_at IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT DO NOTHING
+        """,
+    ]),
+    (3, "multi-unit sale lines", [
+        "ALTER TABLE sales ADD COLUMN IF NOT EXISTS quantity INTEGER NOT NULL DEFAULT 1",
+    ]),
+    (4, "per-shop report indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_sales_product_id_created_at ON sales (product_id, created_at)",
+        # Covered by the index above (same leading column)
+        "DROP INDEX IF EXISTS ix_sales_product_id",
+    ]),
+    (5, "shop and product snapshot on sales", [
+        """
+        ALTER TABLE sales
+            ADD COLUMN IF NOT EXISTS shop_id INTEGER,
+            ADD COLUMN IF NOT EXISTS product_name VARCHAR,
+            ADD COLUMN IF NOT EXISTS unit_price FLOAT,
+            ADD COLUMN IF NOT EXISTS size_cm VARCHAR,
+            ADD COLUMN IF NOT EXISTS color VARCHAR,
+            ADD COLUMN IF NOT EXISTS material VARCHAR
+        """,
+        # Best available history: the product as it is now, the price as sold
+        """
+        UPDATE sales SET
+            shop_id = p.shop_id, product_name = p.name,
+            unit_price = sales.price / NULLIF(sales.quantity, 0),
+            size_cm = p.size_cm, color = p.color, material = p.material
+        FROM products p
+        WHERE p.id = sales.product_id AND sales.shop_id IS NULL
+        """,
+        _add_foreign_key("sales", "shop_id", "shops (id)"),
+        "CREATE INDEX IF NOT EXISTS ix_sales_shop_id_created_at ON sales (shop_id, created_at)",
+    ]),
+    (6, "exact money columns", [
+        _to_money("products", "price"),
+        _to_money("sales", "price", "unit_price"),
+        _to_money("debts", "total_amount", "paid_amount"),
+        _to_money("payments", "amount"),
+        _to_money("daily_sales_rollup", "revenue"),
+        # Re-sum the rollup from the rounded sales rather than rounding float sums;
+        # same aggregation as services.rollup_service.rebuild()
+        "DELETE FROM daily_sales_rollup",
+        """
+        INSERT INTO daily_sales_rollup (shop_id, day, payment_type, product_id, sale_count, revenue)
+        SELECT coalesce(shop_id, 0), date(created_at), coalesce(payment_type, ''),
+               coalesce(product_id, 0), sum(quantity), coalesce(sum(price), 0)
+        FROM sales
+        WHERE is_cleared AND created_at IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        """,
+    ]),
+    (7, "analytics snapshots as rows", [
+        # Replaced by the analytics_snapshots table (created by create_all),
+        # which run_periodically() fills on the next start
+        "DELETE FROM report_snapshots WHERE kind = 'analytics'",
+    ]),
+    (8, "open debts index on the keyset column", [
+        # The open-debt list pages by id, not by created_at
+        "CREATE INDEX IF NOT EXISTS ix_debts_open_id ON debts (id) WHERE NOT is_settled",
+        "DROP INDEX IF EXISTS ix_debts_open_created_at",
+    ]),
+]
+
+
+async def run_migrations(conn):
+    """Apply pending migrations on an open connection (inside its transaction)."""
+    if conn.dialect.name != "postgresql":
+        return
+
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR, "
+        "applied_at TIMESTAMP DEFAULT now())"
+    ))
+    applied = set((await conn.execute(text("SELECT version FROM schema_migrations"))).scalars())
+
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        print(f"🔹 Applying migration {version}: {description}")
+        for statement in statements:
+            await conn.execute(text(statement))
+        await conn.execute(
+            text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+            {"version": version, "description": description}
+        )
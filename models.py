@@ -1,8 +1,9 @@
 from sqlalchemy import (
-    Column, Integer, String, Float, Boolean, ForeignKey, DateTime, BigInteger
+    Column, Integer, String, Text, Boolean, ForeignKey, Date, DateTime, BigInteger, Index
 )
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from database import Base
+from money import Money
 
 # class Shop(Base):
 #     __tablename__ = "shops"
@@ -25,7 +26,7 @@ class Shop(Base):
     id = Column(Integer, primary_key=True)
     shop_number = Column(Integer)
     location = Column(String)
-    owner_id = Column(Integer, ForeignKey("users.id"))  # points to user
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)  # points to user
     created_at = Column(DateTime, server_default=func.now())
 
 
@@ -44,11 +45,14 @@ class User(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        Index("ix_products_shop_id_id", "shop_id", "id"),
+    )
     id = Column(Integer, primary_key=True)
-    shop_id = Column(Integer)
+    shop_id = Column(Integer, ForeignKey("shops.id"))
     name = Column(String)
     quantity = Column(Integer)
-    price = Column(Float)
+    price = Column(Money)
     size_cm = Column(String)
     color = Column(String)
     material = Column(String)
@@ -57,29 +61,56 @@ class Product(Base):
 
 class Sale(Base):
     __tablename__ = "sales"
+    __table_args__ = (
+        Index("ix_sales_is_cleared_created_at", "is_cleared", "created_at"),
+        Index("ix_sales_product_id_created_at", "product_id", "created_at"),
+        # Shop-level reports scan one shop's sales without joining products
+        Index("ix_sales_shop_id_created_at", "shop_id", "created_at"),
+    )
     id = Column(Integer, primary_key=True)
-    product_id = Column(Integer)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="SET NULL"))
     buyer_name = Column(String)
-    price = Column(Float)
+    quantity = Column(Integer, nullable=False, default=1, server_default="1")
+    price = Column(Money)  # line total: unit price * quantity
+    # Shop and product as they were when sold; renames and deletes keep history
+    shop_id = Column(Integer, ForeignKey("shops.id"))
+    product_name = Column(String)
+    unit_price = Column(Money)
+    size_cm = Column(String)
+    color = Column(String)
+    material = Column(String)
     payment_type = Column(String)
     is_cleared = Column(Boolean)
     created_at = Column(DateTime, server_default=func.now())
 
 class Debt(Base):
     __tablename__ = "debts"
+    __table_args__ = (
+        # Only open debts are ever listed (keyset on id), so index just those rows
+        Index(
+            "ix_debts_open_id", "id",
+            postgresql_where=text("NOT is_settled"),
+            sqlite_where=text("NOT is_settled"),
+        ),
+    )
     id = Column(Integer, primary_key=True)
-    sale_id = Column(Integer)
-    total_amount = Column(Float)
-    paid_amount = Column(Float, default=0)
+    # Returned products delete their sale but keep the settled debt
+    sale_id = Column(Integer, ForeignKey("sales.id", ondelete="SET NULL"), index=True)
+    total_amount = Column(Money)
+    paid_amount = Column(Money, default=0)
     is_settled = Column(Boolean, default=False)
     created_at = Column(DateTime, server_default=func.now())
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        # Latest payment per user: WHERE user_id = ? ORDER BY created_at DESC LIMIT 1
+        Index("ix_payments_user_id_created_at", "user_id", text("created_at DESC")),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    amount = Column(Float)
+    amount = Column(Money)
     plan_type = Column(String)  # "1 Month", "3 Months", etc.
     status = Column(String)  # "pending", "completed", "failed"
     payment_method = Column(String, nullable=True)  # "stripe", "paypal", "manual"
@@ -88,4 +119,55 @@ class Payment(Base):
     expires_at = Column(DateTime)
     
     # Relationship
-    # user = relationship("User", back_populates="payments")
\ No newline at end of file
+    # user = relationship("User", back_populates="payments")
+
+
+# Cleared sales pre-aggregated per shop, day, payment type and product;
+# kept in step with sales by services/rollup_service.py
+class DailySalesRollup(Base):
+    __tablename__ = "daily_sales_rollup"
+    __table_args__ = (
+        Index("ix_daily_sales_rollup_day", "day"),
+    )
+
+    shop_id = Column(Integer, primary_key=True)  # 0: product was deleted
+    day = Column(Date, primary_key=True)
+    payment_type = Column(String, primary_key=True)
+    product_id = Column(Integer, primary_key=True)  # 0: product was deleted
+    sale_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Money, nullable=False, default=0)
+
+
+# Report state per shop, precomputed off-peak by services/snapshot_service.py
+class ReportSnapshot(Base):
+    __tablename__ = "report_snapshots"
+
+    shop_id = Column(Integer, primary_key=True)  # summaries are per existing shop (joined from the rollup)
+    kind = Column(String, primary_key=True)  # "day" or "week"
+    period_start = Column(Date, primary_key=True)
+    taken_until = Column(DateTime, nullable=False)  # covers sales made before this moment
+    data = Column(Text, nullable=False)  # compact JSON summary
+    message = Column(Text, nullable=True)  # rendered summary (day and week)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+# All-time analytics aggregates per shop and ranked key, up to taken_until;
+# written by services/snapshot_service.py and ranked in SQL with the newer sales
+class AnalyticsSnapshot(Base):
+    __tablename__ = "analytics_snapshots"
+
+    shop_id = Column(Integer, primary_key=True)  # 0: sale predates the stored shop
+    metric = Column(String, primary_key=True)  # totals, products, buyers, payments, hours, days
+    key = Column(String, primary_key=True)  # "" for totals and for sales without one
+    amount = Column(Money, nullable=False)
+    sale_count = Column(Integer, nullable=False)
+    taken_until = Column(DateTime, nullable=False, index=True)  # covers sales made before this moment
+
+
+class FsmRecord(Base):
+    __tablename__ = "fsm_states"
+
+    key = Column(String, primary_key=True)  # bot:chat:user[:thread]:destiny
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=True)  # compact JSON
+    expires_at = Column(DateTime, index=True)
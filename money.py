@@ -0,0 +1,35 @@
+"""
+Money amounts.
+
+Prices, sale totals, debts, payments and the revenue rollup are stored as
+NUMERIC(12, 2) and read back as Decimal, so sums are exact in the database
+and stay exact in Python. Amounts entered by users (or kept in FSM state,
+which is JSON) go through to_money() before they reach a column.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from sqlalchemy import Numeric
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+# Column type of every money column (and of SQL expressions summing them)
+Money = Numeric(12, 2)
+
+
+def to_money(value):
+    """
+    Decimal rounded to cents from a Decimal, int, float or user-entered
+    string ("12,5" is accepted). Raises ValueError on anything else.
+    """
+    if isinstance(value, str):
+        value = value.strip().replace(",", ".")
+    elif isinstance(value, float):
+        value = repr(value)  # 9.99, not 9.9900000000000002131...
+    try:
+        amount = Decimal(value)
+    except (InvalidOperation, TypeError):
+        raise ValueError(f"not a money amount: {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"not a money amount: {value!r}")
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
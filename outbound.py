@@ -0,0 +1,182 @@
+"""
+Central, rate-limited sender for outgoing Telegram messages.
+
+OutboundSender is installed as a request middleware on the bot session, so
+every message.answer / edit_text / bot.send_message in the handlers goes
+through it unchanged. Requests that send or edit messages in a chat are
+queued per chat and drained by one task per chat, which takes a token from
+the chat's bucket and from the global bucket before each request. Plain
+texts that concurrent senders (updates of one chat handled in parallel)
+queue for a chat while it waits for a token are sent as one message (up
+to Telegram's 4096-character limit); a single handler's answer() calls
+are not merged, since each one waits for its own reply. A 429 RetryAfter
+pauses all sending for the requested time and the request is retried.
+Everything else (getUpdates, getChat, answerCallbackQuery, setWebhook...)
+passes straight through.
+"""
+import asyncio
+from collections import deque
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from config import (
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_CHAT_RATE,
+    OUTBOUND_CHAT_BURST,
+    OUTBOUND_MAX_RETRIES,
+)
+
+MESSAGE_LIMIT = 4096
+SEPARATOR = "\n\n"
+
+# API methods that count against Telegram's flood limits
+LIMITED_METHODS = ("send", "edit", "copy", "forward")
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = asyncio.get_running_loop().time()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def full(self):
+        elapsed = asyncio.get_running_loop().time() - self.updated
+        return self.tokens + elapsed * self.rate >= self.capacity
+
+
+def _mergeable(first, second):
+    """Plain texts to the same chat that can go out as one message."""
+    return (
+        isinstance(first, SendMessage)
+        and isinstance(second, SendMessage)
+        and first.reply_markup is None
+        and not first.entities and not second.entities
+        and first.reply_parameters is None and second.reply_parameters is None
+        and first.reply_to_message_id is None and second.reply_to_message_id is None
+        and first.parse_mode == second.parse_mode
+        and first.message_thread_id == second.message_thread_id
+        and len(first.text) + len(SEPARATOR) + len(second.text) <= MESSAGE_LIMIT
+    )
+
+
+class OutboundSender(BaseRequestMiddleware):
+    def __init__(self, global_rate=OUTBOUND_GLOBAL_RATE, chat_rate=OUTBOUND_CHAT_RATE,
+                 chat_burst=OUTBOUND_CHAT_BURST, max_retries=OUTBOUND_MAX_RETRIES):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.global_bucket = None
+        self.buckets = {}  # chat_id -> TokenBucket
+        self.queues = {}  # chat_id -> deque of (make_request, bot, method, future)
+        self.drains = {}  # chat_id -> draining task
+        self.paused_until = 0.0
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not method.__api_method__.startswith(LIMITED_METHODS):
+            return await make_request(bot, method)
+
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(chat_id, deque()).append((make_request, bot, method, future))
+        if chat_id not in self.drains:
+            self.drains[chat_id] = asyncio.create_task(self._drain(chat_id))
+        return await future
+
+    def _bucket(self, chat_id):
+        if self.global_bucket is None:
+            self.global_bucket = TokenBucket(self.global_rate, self.global_rate)
+        if chat_id not in self.buckets:
+            self.buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return self.buckets[chat_id]
+
+    def _next(self, queue):
+        """Pop the next request, folding following plain texts into it."""
+        make_request, bot, method, future = queue.popleft()
+        futures = [future]
+        while queue and _mergeable(method, queue[0][2]):
+            _, _, following, future = queue.popleft()
+            method = following.model_copy(update={"text": method.text + SEPARATOR + following.text})
+            futures.append(future)
+            self.coalesced += 1
+        return make_request, bot, method, futures
+
+    async def _drain(self, chat_id):
+        queue = self.queues[chat_id]
+        bucket = self._bucket(chat_id)
+        try:
+            while queue:
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+                make_request, bot, method, futures = self._next(queue)
+                await self._send(make_request, bot, method, futures)
+        finally:
+            del self.drains[chat_id]
+            del self.queues[chat_id]
+            if bucket.full():
+                self.buckets.pop(chat_id, None)  # idle chat: forget its bucket
+
+    async def _send(self, make_request, bot, method, futures):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            delay = self.paused_until - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    error = e
+                    break
+                self.retried += 1
+                self.paused_until = max(self.paused_until, loop.time() + e.retry_after)
+                continue
+            except Exception as e:
+                error = e
+                break
+            self.sent += 1
+            for future in futures:
+                if not future.done():
+                    future.set_result(result)
+            return
+
+        self.failed += 1
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+    def depth(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "chats_waiting": len(self.queues),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+    async def close(self, timeout=10):
+        """Deliver what is queued (up to `timeout` seconds)."""
+        if self.drains:
+            await asyncio.wait(list(self.drains.values()), timeout=timeout)
@@ -0,0 +1,75 @@
+from sqlalchemy import select, func, true
+from models import Debt, Sale
+
+DEBTS_PAGE_SIZE = 8
+BUYERS_LIMIT = 20
+
+
+def _open_debts(shop_ids):
+    """Unsettled debts of `shop_ids`: Debt JOIN Sale (the sale stores its shop)."""
+    return (
+        select()
+        .select_from(Debt)
+        .join(Sale, Sale.id == Debt.sale_id)
+        .where(Sale.shop_id.in_(shop_ids), Debt.is_settled == False)
+    )
+
+
+def _remaining():
+    return Debt.total_amount - func.coalesce(Debt.paid_amount, 0)
+
+
+async def open_debts_page(session, shop_ids, after_id=None, before_id=None, page_size=DEBTS_PAGE_SIZE):
+    """
+    One keyset page of open debts plus the overall outstanding totals.
+
+    The totals are scalar subqueries over the same scope, so the whole page
+    is a single round-trip. Returns (rows, totals, has_prev, has_next) where
+    totals is (count, outstanding).
+    """
+    totals = _open_debts(shop_ids).add_columns(
+        func.count(Debt.id).label("total_count"),
+        func.coalesce(func.sum(_remaining()), 0).label("total_outstanding"),
+    ).subquery()
+
+    stmt = _open_debts(shop_ids).add_columns(
+        Debt.id,
+        Debt.sale_id,
+        Debt.total_amount,
+        Debt.paid_amount,
+        _remaining().label("remaining"),
+        Sale.buyer_name,
+        Sale.product_name,
+        totals.c.total_count,
+        totals.c.total_outstanding,
+    ).join(totals, true())
+
+    if before_id is not None:
+        stmt = stmt.where(Debt.id < before_id).order_by(Debt.id.desc())
+    else:
+        stmt = stmt.where(Debt.id > (after_id or 0)).order_by(Debt.id)
+
+    rows = (await session.execute(stmt.limit(page_size + 1))).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if before_id is not None:
+        rows = list(reversed(rows))
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = bool(after_id), has_more
+
+    page_totals = (rows[0].total_count, rows[0].total_outstanding) if rows else (0, 0)
+    return rows, page_totals, has_prev, has_next
+
+
+async def outstanding_by_buyer(session, shop_ids, limit=BUYERS_LIMIT):
+    """Per-buyer open debt count and outstanding amount, largest first."""
+    outstanding = func.sum(_remaining())
+    stmt = _open_debts(shop_ids).add_columns(
+        Sale.buyer_name,
+        func.count(Debt.id).label("count"),
+        outstanding.label("outstanding"),
+    ).group_by(Sale.buyer_name).order_by(outstanding.desc(), Sale.buyer_name).limit(limit)
+
+    return (await session.execute(stmt)).all()
@@ -0,0 +1,137 @@
+"""
+Streaming CSV/XLSX export of sales, debts and inventory.
+
+Rows are fetched through a server-side cursor (stream + yield_per) and
+written to a temporary file one by one, so memory use does not grow with
+the size of the export. The caller sends the file and deletes it.
+"""
+import csv
+import os
+import tempfile
+
+from sqlalchemy import select, func
+from models import Sale, Debt, Product, Shop
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = ("csv", "xlsx")
+
+
+def _sales(shop_ids, start_date, end_date):
+    stmt = (
+        select(
+            Sale.id, Sale.created_at, Shop.shop_number, Sale.product_name, Sale.buyer_name,
+            Sale.quantity, Sale.unit_price, Sale.price, Sale.payment_type, Sale.is_cleared
+        )
+        .join(Shop, Shop.id == Sale.shop_id)
+        .where(Shop.id.in_(shop_ids))
+        .order_by(Sale.id)
+    )
+    if start_date:
+        stmt = stmt.where(Sale.created_at >= start_date)
+    if end_date:
+        stmt = stmt.where(Sale.created_at <= end_date)
+    return stmt
+
+
+def _debts(shop_ids, start_date, end_date):
+    stmt = (
+        select(
+            Debt.id, Debt.created_at, Shop.shop_number, Sale.product_name, Sale.buyer_name,
+            Debt.total_amount, Debt.paid_amount,
+            (Debt.total_amount - func.coalesce(Debt.paid_amount, 0)).label("remaining"),
+            Debt.is_settled
+        )
+        .join(Sale, Sale.id == Debt.sale_id)
+        .join(Shop, Shop.id == Sale.shop_id)
+        .where(Shop.id.in_(shop_ids))
+        .order_by(Debt.id)
+    )
+    if start_date:
+        stmt = stmt.where(Debt.created_at >= start_date)
+    if end_date:
+        stmt = stmt.where(Debt.created_at <= end_date)
+    return stmt
+
+
+def _products(shop_ids, start_date, end_date):
+    # Inventory is a snapshot: the period does not apply
+    return (
+        select(
+            Product.id, Shop.shop_number, Product.name, Product.quantity, Product.price,
+            Product.size_cm, Product.color, Product.material, Product.status, Product.created_at
+        )
+        .join(Shop, Shop.id == Product.shop_id)
+        .where(Shop.id.in_(shop_ids))
+        .order_by(Product.id)
+    )
+
+
+# kind -> (header row, query builder)
+EXPORTS = {
+    "sales": (
+        ["id", "date", "shop", "product", "buyer", "quantity", "unit_price", "amount", "payment_type", "cleared"],
+        _sales,
+    ),
+    "debts": (
+        ["id", "date", "shop", "product", "buyer", "total", "paid", "remaining", "settled"],
+        _debts,
+    ),
+    "products": (
+        ["id", "shop", "name", "quantity", "price", "size_cm", "color", "material", "status", "created_at"],
+        _products,
+    ),
+}
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="", encoding="utf-8-sig")  # BOM: opens in Excel
+        self.writer = csv.writer(self.file)
+
+    def append(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+class _XlsxWriter:
+    def __init__(self, path):
+        # Optional dependency: only needed for .xlsx exports
+        from openpyxl import Workbook
+        self.path = path
+        self.workbook = Workbook(write_only=True)  # rows are flushed as they are added
+        self.sheet = self.workbook.create_sheet()
+
+    def append(self, row):
+        self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+async def write_export(session, kind, shop_ids, start_date=None, end_date=None, fmt="csv"):
+    """
+    Stream one export into a temporary file.
+    Returns (path, number of rows); the caller removes the file.
+    """
+    header, build = EXPORTS[kind]
+    stmt = build(shop_ids, start_date, end_date).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    count = 0
+    try:
+        writer = _XlsxWriter(path) if fmt == "xlsx" else _CsvWriter(path)
+        try:
+            writer.append(header)
+            result = await session.stream(stmt)
+            async for row in result:
+                writer.append(list(row))
+                count += 1
+        finally:
+            writer.close()
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
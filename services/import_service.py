@@ -0,0 +1,127 @@
+"""
+Bulk product import from CSV/XLSX files.
+
+Rows are read one at a time from the uploaded file, validated with the same
+rules as the step-by-step "add product" flow and inserted in batches with a
+single executemany INSERT per batch. Invalid rows are skipped and reported
+back by line number; the valid ones are committed together.
+"""
+import csv
+import io
+
+from sqlalchemy import insert
+from models import Product
+from money import to_money
+
+IMPORT_EXTENSIONS = (".csv", ".xlsx")
+IMPORT_BATCH_SIZE = 500
+
+# Column -> accepted header names (English or Russian, any case)
+COLUMNS = {
+    "name": ("name", "название"),
+    "quantity": ("quantity", "количество"),
+    "price": ("price", "цена"),
+    "size_cm": ("size", "size_cm", "размер"),
+    "color": ("color", "цвет"),
+    "material": ("material", "материал"),
+}
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(text, dialect)
+
+
+def _xlsx_rows(stream):
+    # Optional dependency: only needed for .xlsx files
+    from openpyxl import load_workbook
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_rows(stream, filename):
+    """Yield (line number, {column: text}) for each data row of the file."""
+    rows = _xlsx_rows(stream) if filename.lower().endswith(".xlsx") else _csv_rows(stream)
+
+    header = [_cell(value).lower() for value in next(rows, [])]
+    positions = {}
+    for column, names in COLUMNS.items():
+        found = [i for i, title in enumerate(header) if title in names]
+        if not found:
+            raise ValueError(f"нет колонки «{names[1]}» ({names[0]})")
+        positions[column] = found[0]
+
+    for line, row in enumerate(rows, start=2):
+        values = {
+            column: _cell(row[i]) if i < len(row) else ""
+            for column, i in positions.items()
+        }
+        if any(values.values()):  # skip blank lines
+            yield line, values
+
+
+def parse_row(values):
+    """Validate one row; returns the Product column values or raises ValueError."""
+    for column in ("name", "size_cm", "color", "material"):
+        if not values[column]:
+            raise ValueError(f"пустое поле «{COLUMNS[column][1]}»")
+
+    try:
+        quantity = int(values["quantity"])
+    except ValueError:
+        raise ValueError("количество должно быть целым числом")
+    if quantity <= 0:
+        raise ValueError("количество должно быть положительным")
+
+    try:
+        price = to_money(values["price"])
+    except ValueError:
+        raise ValueError("цена должна быть числом")
+    if price <= 0:
+        raise ValueError("цена должна быть положительной")
+
+    return dict(values, quantity=quantity, price=price)
+
+
+async def import_products(session, shop_id, rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Insert parsed rows into `shop_id` in executemany batches and commit once.
+    Returns (number imported, [(line, error), ...]).
+    """
+    imported, errors, batch = 0, [], []
+
+    for line, values in rows:
+        try:
+            batch.append(dict(parse_row(values), shop_id=shop_id, status="available"))
+        except ValueError as e:
+            errors.append((line, str(e)))
+            continue
+
+        if len(batch) >= batch_size:
+            await session.execute(insert(Product), batch)
+            imported += len(batch)
+            batch = []
+
+    if batch:
+        await session.execute(insert(Product), batch)
+        imported += len(batch)
+
+    await session.commit()
+    return imported, errors
@@ -0,0 +1,33 @@
+from sqlalchemy import select
+from models import Product
+
+PRODUCTS_PAGE_SIZE = 10
+
+
+async def product_page(session, shop_ids, after_id=None, before_id=None, page_size=PRODUCTS_PAGE_SIZE):
+    """
+    One keyset page of the products of `shop_ids`, ordered by id (an index
+    range on products (shop_id, id) per shop).
+
+    Pass `after_id` (last id of the current page) to move forward or
+    `before_id` (first id of the current page) to move back. One extra row
+    is fetched to know whether another page exists in that direction.
+    Returns (products, has_prev, has_next).
+    """
+    if not shop_ids:
+        return [], False, False
+
+    stmt = select(Product).where(Product.shop_id.in_(shop_ids))
+
+    if before_id is not None:
+        stmt = stmt.where(Product.id < before_id).order_by(Product.id.desc())
+    else:
+        stmt = stmt.where(Product.id > (after_id or 0)).order_by(Product.id)
+
+    products = (await session.scalars(stmt.limit(page_size + 1))).all()
+    has_more = len(products) > page_size
+    products = products[:page_size]
+
+    if before_id is not None:
+        return list(reversed(products)), has_more, True
+    return products, bool(after_id), has_more
@@ -0,0 +1,96 @@
+"""
+In-process cache of computed reports.
+
+Entries are keyed by (shops, report kind, period bucket) and stamped with
+the sales version of those shops. rollup_service marks a shop as changed
+whenever one of its cleared sales is added, re-typed or removed (sales,
+debt payments, returns), and the version is bumped once that transaction
+commits, so a cached report is never served after a change made in this
+process. Repeat views of an unchanged report cost no queries. Like the
+user cache, entries also expire after REPORT_CACHE_TTL, which bounds how
+long another replica's writes can go unseen.
+"""
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import REPORT_CACHE_SIZE, REPORT_CACHE_TTL
+
+
+class ReportCache:
+    """LRU + TTL cache: (shops, kind, bucket) -> (sales version, result)."""
+
+    def __init__(self, max_size=REPORT_CACHE_SIZE, ttl=REPORT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}  # shop_id -> sales version
+        self._version = 0  # bumped with every shop
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, shop_ids=None):
+        """Sales version of some shops, or of all of them (None)."""
+        if shop_ids is None:
+            return self._version
+        return tuple(self._versions.get(shop_id, 0) for shop_id in shop_ids)
+
+    def bump(self, shop_id):
+        self._versions[shop_id] = self._versions.get(shop_id, 0) + 1
+        self._version += 1
+
+    def get(self, key, version):
+        """Returns (found, result)."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic() or entry[1] != version:
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[2]
+
+    def set(self, key, version, result):
+        self._entries[key] = (time.monotonic() + self.ttl, version, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, kind, bucket, compute, shop_ids=None):
+        """
+        Cached result of `await compute()` for a report of `shop_ids` (all
+        shops when None) over a period identified by `bucket`.
+        """
+        scope = tuple(shop_ids) if shop_ids is not None else None
+        key = (scope, kind, bucket)
+        # Read the version first: a sale committed while computing makes
+        # the stored entry outdated instead of stale
+        version = self.version(scope)
+        found, result = self.get(key, version)
+        if not found:
+            result = await compute()
+            self.set(key, version, result)
+        return result
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+report_cache = ReportCache()
+
+
+def sales_changed(session, shop_id):
+    """Bump `shop_id`'s sales version when `session` commits."""
+    session.info.setdefault("changed_shops", set()).add(shop_id or 0)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    for shop_id in session.info.pop("changed_shops", ()):
+        report_cache.bump(shop_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("changed_shops", None)
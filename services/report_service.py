@@ -0,0 +1,198 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import (
+    select, func, cast, extract, literal_column, union_all, case, or_, and_, String, Integer
+)
+from models import Sale, Product, DailySalesRollup
+from money import ZERO
+
+
+def _cleared_in_period(stmt, start_date, end_date):
+    return stmt.where(
+        Sale.is_cleared == True,
+        Sale.created_at >= start_date,
+        Sale.created_at <= end_date
+    )
+
+
+def _rollup_in_period(stmt, start_date, end_date, shop_ids=None):
+    # Reports cover whole days, so the day rollup answers them exactly;
+    # its key leads with shop_id, so one shop reads only its own rows
+    stmt = stmt.where(
+        DailySalesRollup.day >= start_date.date(),
+        DailySalesRollup.day <= end_date.date()
+    )
+    if shop_ids is not None:
+        stmt = stmt.where(DailySalesRollup.shop_id.in_(shop_ids))
+    return stmt
+
+
+async def sales_summary(session, start_date, end_date, shop_ids=None, top_n=3, recent_n=5):
+    """
+    Aggregate cleared sales of `shop_ids` (all shops when None) for a period.
+
+    Totals and the top-N products come from daily_sales_rollup (window sums
+    over the per-product GROUP BY), so the cost depends on the number of
+    days in the period, not on the number of sales; a second statement
+    fetches only the most recent sales.
+    """
+    sale_count = func.sum(DailySalesRollup.sale_count)
+    revenue = func.sum(DailySalesRollup.revenue)
+
+    top_stmt = _rollup_in_period(
+        select(
+            Product.name,
+            sale_count.label("count"),
+            revenue.label("revenue"),
+            func.sum(sale_count).over().label("total_items"),
+            func.sum(revenue).over().label("total_amount"),
+        ).select_from(DailySalesRollup).outerjoin(Product, Product.id == DailySalesRollup.product_id),
+        start_date, end_date, shop_ids
+    ).group_by(Product.name).order_by(
+        Product.name.is_(None), sale_count.desc(), Product.name
+    ).limit(top_n + 1)
+
+    rows = (await session.execute(top_stmt)).all()
+    if not rows:
+        return None
+
+    recent_stmt = _cleared_in_period(
+        select(
+            Sale.product_name.label("name"),
+            Sale.quantity,
+            Sale.price,
+            Sale.buyer_name,
+            Sale.payment_type,
+            Sale.created_at,
+        ),
+        start_date, end_date
+    ).order_by(Sale.created_at.desc(), Sale.id.desc()).limit(recent_n)
+    if shop_ids is not None:
+        recent_stmt = recent_stmt.where(Sale.shop_id.in_(shop_ids))
+
+    recent = (await session.execute(recent_stmt)).all()
+
+    return {
+        "total_amount": rows[0].total_amount,
+        "total_items": rows[0].total_items,
+        # Sales of deleted products count towards totals, not the top list
+        "top_products": [(r.name, r.count) for r in rows if r.name is not None][:top_n],
+        "recent_sales": recent,
+    }
+
+
+async def period_totals(session, start_date, end_date, shop_ids=None):
+    """(revenue, number of sales) of cleared sales in a period, from the rollup."""
+    row = (await session.execute(_rollup_in_period(
+        select(
+            func.coalesce(func.sum(DailySalesRollup.revenue), 0),
+            func.coalesce(func.sum(DailySalesRollup.sale_count), 0),
+        ),
+        start_date, end_date, shop_ids
+    ))).one()
+    return row[0], row[1]
+
+
+ANALYTICS_TOP_N = 5
+
+
+def _grouped(name, key=None, where=()):
+    """
+    One branch of the analytics UNION: cleared sales summed per shop (0 for
+    sales that predate the stored shop) and per `key` ("" when missing).
+    """
+    shop_id = func.coalesce(Sale.shop_id, 0)
+    group_key = literal_column("''", String) if key is None else func.coalesce(cast(key, String), "")
+
+    stmt = select(
+        literal_column(f"'{name}'", String).label("metric"),
+        shop_id.label("shop_id"),
+        group_key.label("key"),
+        func.coalesce(func.sum(Sale.price), 0).label("amount"),
+        func.coalesce(func.sum(Sale.quantity), 0).label("sale_count"),
+    ).where(Sale.is_cleared == True, *where)
+    return stmt.group_by(shop_id) if key is None else stmt.group_by(shop_id, key)
+
+
+def analytics_rows(since=None, until=None, shop_ids=None):
+    """
+    UNION ALL branches of everything the analytics screens rank, for cleared
+    sales of `shop_ids` (all shops when None) made in [since, until): rows
+    of (metric, shop_id, key, amount, sale_count). Rows of several periods
+    add up.
+    """
+    scope = []
+    if shop_ids is not None:
+        scope.append(Sale.shop_id.in_(shop_ids))
+    if since is not None:
+        scope.append(Sale.created_at >= since)
+    if until is not None:
+        scope.append(Sale.created_at < until)
+    dated = [Sale.created_at.isnot(None), *scope]
+
+    return [
+        _grouped("totals", where=scope),
+        _grouped("products", Sale.product_name, where=[Sale.product_name.isnot(None), *scope]),
+        _grouped("buyers", Sale.buyer_name, where=scope),
+        _grouped("payments", Sale.payment_type, where=[Sale.payment_type.isnot(None), *scope]),
+        _grouped("hours", cast(extract("hour", Sale.created_at), Integer), where=dated),
+        _grouped("days", func.date(Sale.created_at), where=dated),
+    ]
+
+
+async def ranked_analytics(session, sources, top_n=ANALYTICS_TOP_N, days=7):
+    """
+    Merge UNION ALL branches of (metric, shop_id, key, amount, sale_count)
+    rows and rank them in the database, per metric with ROW_NUMBER(), into
+    what the analytics dashboard and the detailed view show. Only the
+    ranked rows come back.
+    """
+    rows = union_all(*sources).subquery()
+    merged = select(
+        rows.c.metric,
+        rows.c.key,
+        func.sum(rows.c.amount).label("amount"),
+        func.sum(rows.c.sale_count).label("sale_count"),
+    ).group_by(rows.c.metric, rows.c.key).subquery()
+
+    # Peak hours and the best day rank by number of sales, the rest by amount
+    by_count = merged.c.metric.in_(("hours", "days"))
+    first = case((by_count, merged.c.sale_count), else_=merged.c.amount)
+    second = case((by_count, merged.c.amount), else_=merged.c.sale_count)
+    ranked = select(
+        merged,
+        func.row_number().over(
+            partition_by=merged.c.metric, order_by=(first.desc(), second.desc(), merged.c.key)
+        ).label("rank"),
+        func.row_number().over(
+            partition_by=merged.c.metric, order_by=merged.c.key.desc()
+        ).label("recent"),
+    ).subquery()
+
+    since = (datetime.now() - timedelta(days=days)).date().isoformat()
+    limit = case((ranked.c.metric == "payments", 10), (ranked.c.metric == "days", 1), else_=top_n)
+    stmt = select(ranked).where(or_(
+        ranked.c.rank <= limit,
+        and_(ranked.c.metric == "days", ranked.c.key >= since, ranked.c.recent <= days),
+    ))
+
+    metrics = defaultdict(list)
+    for row in sorted((await session.execute(stmt)).all(), key=lambda r: (r.metric, r.rank)):
+        metrics[row.metric].append(row)
+
+    def top(metric):
+        return [row for row in metrics[metric] if row.rank <= top_n]
+
+    totals = metrics["totals"][0] if metrics["totals"] else None
+    return {
+        "total_amount": totals.amount if totals else ZERO,
+        "total_items": totals.sale_count if totals else 0,
+        "top_products": [(r.key, r.amount) for r in top("products")],
+        "top_buyers": [(r.key or None, r.amount) for r in top("buyers")],
+        "daily_revenue": sorted(
+            (r.key, r.amount) for r in metrics["days"] if r.key >= since and r.recent <= days
+        ),
+        "payment_methods": [(r.key, r.amount) for r in metrics["payments"]],
+        "peak_hours": [(int(r.key), r.sale_count) for r in top("hours")],
+        "best_day": next(((r.key, r.sale_count) for r in metrics["days"] if r.rank == 1), None),
+    }
@@ -0,0 +1,90 @@
+"""
+Maintenance of the daily_sales_rollup table.
+
+Period reports read pre-aggregated rows (one per shop, day, payment type
+and product) instead of scanning every sale. Handlers that create, clear,
+re-type or delete a cleared sale call add_sale()/remove_sale() in the same
+transaction as the change itself, so the rollup never drifts from sales.
+The shop is the one stored on the sale, so it survives product deletes.
+The same calls keep the analytics snapshot rows in step
+(snapshot_service.apply_sale()).
+rebuild() recomputes the whole table (`python manage.py rebuild-rollup`).
+"""
+from sqlalchemy import select, delete, insert, func
+from sqlalchemy.dialects import postgresql, sqlite
+from models import DailySalesRollup, Sale
+from services.report_cache import sales_changed
+from services.snapshot_service import apply_sale
+
+_KEY = ("shop_id", "day", "payment_type", "product_id")
+
+
+def _upsert(session):
+    dialect = session.get_bind().dialect.name
+    return postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+
+def _key(sale):
+    return {
+        "shop_id": sale.shop_id or 0,
+        "day": sale.created_at.date(),
+        "payment_type": sale.payment_type or "",
+        "product_id": sale.product_id or 0,
+    }
+
+
+async def _apply(session, sale, sign):
+    sales_changed(session, sale.shop_id)
+    key = _key(sale)
+    stmt = _upsert(session)(DailySalesRollup).values(
+        **key, sale_count=sign * sale.quantity, revenue=sign * (sale.price or 0)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(_KEY),
+        set_={
+            "sale_count": DailySalesRollup.sale_count + stmt.excluded.sale_count,
+            "revenue": DailySalesRollup.revenue + stmt.excluded.revenue,
+        }
+    )
+    await session.execute(stmt)
+
+    if sign < 0:
+        await session.execute(
+            delete(DailySalesRollup).where(
+                *(getattr(DailySalesRollup, column) == value for column, value in key.items()),
+                DailySalesRollup.sale_count <= 0
+            )
+        )
+
+    await apply_sale(session, sale, sign)
+
+
+async def add_sale(session, sale):
+    """Count a cleared sale line. `sale.created_at` must be loaded (flush + refresh)."""
+    await _apply(session, sale, 1)
+
+
+async def remove_sale(session, sale):
+    """Undo add_sale() before a cleared sale is deleted or re-typed."""
+    await _apply(session, sale, -1)
+
+
+async def rebuild(session):
+    """Recompute the rollup from sales; returns the number of rows written."""
+    key = (
+        func.coalesce(Sale.shop_id, 0),
+        func.date(Sale.created_at),
+        func.coalesce(Sale.payment_type, ""),
+        func.coalesce(Sale.product_id, 0),
+    )
+    totals = (
+        select(*key, func.sum(Sale.quantity), func.coalesce(func.sum(Sale.price), 0))
+        .where(Sale.is_cleared == True, Sale.created_at.isnot(None))
+        .group_by(*key)
+    )
+
+    await session.execute(delete(DailySalesRollup))
+    result = await session.execute(
+        insert(DailySalesRollup).from_select(list(_KEY) + ["sale_count", "revenue"], totals)
+    )
+    return result.rowcount
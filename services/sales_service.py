@@ -1 +1,129 @@
+"""
+Recording sales.
 
+A sale is one or more line items (product, quantity) for one buyer. Every
+call below is one transaction: take the units off stock, insert the sale
+lines (and debts) with RETURNING instead of a refresh, count them in the
+daily rollup and commit once. Either everything is written or nothing is.
+Each line keeps the shop and a copy of the product (name, unit price,
+attributes) as sold.
+"""
+from sqlalchemy import update, insert, case
+from models import Product, Sale, Debt
+from services.rollup_service import add_sale
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_id):
+        super().__init__(product_id)
+        self.product_id = product_id
+
+
+async def take_units(session, product_id, quantity, status):
+    """
+    Take `quantity` units of a product off stock, atomically.
+
+    A single conditional UPDATE ... WHERE quantity >= n RETURNING: the row
+    lock it takes serialises concurrent sales of the same product until the
+    caller commits, and the second seller re-checks the quantity after the
+    first one's commit, so stock can never go negative. `status` is set
+    only when the last unit leaves. Returns the updated product row, or
+    None when the product is gone or has fewer units left.
+    """
+    stmt = (
+        update(Product)
+        .where(Product.id == product_id, Product.quantity >= quantity)
+        .values(
+            quantity=Product.quantity - quantity,
+            status=case((Product.quantity - quantity <= 0, status), else_=Product.status)
+        )
+        .returning(
+            Product.id, Product.shop_id, Product.name, Product.price, Product.quantity,
+            Product.size_cm, Product.color, Product.material
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return (await session.execute(stmt)).first()
+
+
+async def record_sale(session, buyer_name, items, payment_type):
+    """
+    Sell line items [(product_id, quantity), ...] to one buyer.
+
+    payment_type "borrowed" records a credit sale with one open debt per
+    line; anything else ("cash", "card", "pending") is a cleared sale.
+    Returns [(product, sale), ...] in the order of `items`. Raises
+    OutOfStock (after rolling back) if any line cannot be served.
+    """
+    credit = payment_type == "borrowed"
+
+    # Lock products in id order so two carts never wait on each other
+    products = {}
+    for product_id, quantity in sorted(items):
+        product = await take_units(session, product_id, quantity, "borrowed" if credit else "sold")
+        if not product:
+            await session.rollback()
+            raise OutOfStock(product_id)
+        products[product_id] = product
+
+    sales = (await session.execute(
+        insert(Sale).returning(
+            Sale.id, Sale.product_id, Sale.shop_id, Sale.quantity, Sale.price,
+            Sale.payment_type, Sale.created_at, Sale.buyer_name, Sale.product_name,
+            sort_by_parameter_order=True
+        ),
+        [
+            {
+                "product_id": product_id,
+                "buyer_name": buyer_name,
+                "quantity": quantity,
+                "price": products[product_id].price * quantity,
+                "is_cleared": not credit,
+                "payment_type": payment_type,
+                # Snapshot of the product as sold
+                "shop_id": products[product_id].shop_id,
+                "product_name": products[product_id].name,
+                "unit_price": products[product_id].price,
+                "size_cm": products[product_id].size_cm,
+                "color": products[product_id].color,
+                "material": products[product_id].material,
+            }
+            for product_id, quantity in items
+        ]
+    )).all()
+
+    if credit:
+        await session.execute(insert(Debt), [
+            {"sale_id": sale.id, "total_amount": sale.price, "paid_amount": 0, "is_settled": False}
+            for sale in sales
+        ])
+    else:
+        for sale in sales:
+            await add_sale(session, sale)
+
+    await session.commit()
+    return [(products[sale.product_id], sale) for sale in sales]
+
+
+async def record_cleared_sale(session, product_id, buyer_name, payment_type="pending"):
+    """
+    Sell one unit for money. Returns (product, sale) rows, or None when the
+    product is gone or out of stock (nothing is written then).
+    """
+    try:
+        [line] = await record_sale(session, buyer_name, [(product_id, 1)], payment_type)
+    except OutOfStock:
+        return None
+    return line
+
+
+async def record_credit_sale(session, product_id, buyer_name):
+    """
+    Give one unit on credit: the sale plus its open debt. Returns
+    (product, sale), or None when the product is gone or out of stock.
+    """
+    try:
+        [line] = await record_sale(session, buyer_name, [(product_id, 1)], "borrowed")
+    except OutOfStock:
+        return None
+    return line
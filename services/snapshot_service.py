@@ -0,0 +1,274 @@
+"""
+Precomputed report snapshots.
+
+Once a night (SNAPSHOT_HOUR, off-peak) run_periodically() stores, per shop:
+- the all-time analytics aggregates up to midnight, one analytics_snapshots
+  row per metric and key;
+- "day": yesterday's summary, rendered, and pushed to the owner when
+  SNAPSHOT_PUSH is on;
+- "week": the same for the week that just ended (on Mondays).
+
+The analytics buttons then rank the latest snapshot rows together with the
+sales made since it was taken, in one statement, instead of scanning every
+sale on each press. Older sales that change later (a debt paid, a return,
+a new payment type) are applied to the snapshot rows in the same
+transaction by apply_sale(), called from rollup_service, so analytics are
+as current as the rollup that period reports read.
+
+Snapshots are keyed by shop and period, so replicas racing on the same
+night write the same rows and only the one that inserted a summary pushes
+it.
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, func, literal, true, union_all, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from config import SNAPSHOT_HOUR, SNAPSHOT_PUSH
+from database import AsyncSessionLocal
+from money import ZERO
+from models import ReportSnapshot, AnalyticsSnapshot, DailySalesRollup, Product, Shop, User
+from services.report_service import ANALYTICS_TOP_N, analytics_rows, ranked_analytics
+
+SUMMARY_TOP_N = 3
+
+
+def _insert(session):
+    dialect = session.get_bind().dialect.name
+    return postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+
+def _dumps(value):
+    # Money amounts (Decimal) are stored as strings to stay exact
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+async def current_analytics(session, shop_ids=None, top_n=ANALYTICS_TOP_N, days=7):
+    """
+    Analytics of `shop_ids` (all shops when None): their latest snapshot
+    rows plus the sales made since, ranked in one round-trip.
+    """
+    cutoff = select(func.max(AnalyticsSnapshot.taken_until)).scalar_subquery()
+
+    snapshot = select(
+        AnalyticsSnapshot.metric,
+        AnalyticsSnapshot.shop_id,
+        AnalyticsSnapshot.key,
+        AnalyticsSnapshot.amount,
+        AnalyticsSnapshot.sale_count,
+    ).where(AnalyticsSnapshot.taken_until == cutoff)
+    if shop_ids is not None:
+        snapshot = snapshot.where(AnalyticsSnapshot.shop_id.in_(shop_ids))
+
+    # No snapshot yet: every sale is new
+    since = func.coalesce(cutoff, datetime.min)
+    return await ranked_analytics(
+        session, [snapshot, *analytics_rows(since=since, shop_ids=shop_ids)], top_n, days
+    )
+
+
+def _analytics_keys(sale):
+    """The (metric, key) rows of report_service.analytics_rows() a cleared sale counts in."""
+    keys = [("totals", ""), ("buyers", sale.buyer_name or "")]
+    if sale.product_name is not None:
+        keys.append(("products", sale.product_name))
+    if sale.payment_type is not None:
+        keys.append(("payments", sale.payment_type))
+    keys.append(("hours", str(sale.created_at.hour)))
+    keys.append(("days", sale.created_at.date().isoformat()))
+    return keys
+
+
+async def apply_sale(session, sale, sign):
+    """
+    Add (sign=1) or subtract (sign=-1) a cleared sale in the analytics
+    snapshot when the snapshot covers it (made before its cutoff); newer
+    sales are read from the sales table anyway. The cutoff is looked up
+    once per transaction, so a cart of several lines costs one query.
+    """
+    if "analytics_cutoff" not in session.info:
+        session.info["analytics_cutoff"] = await session.scalar(
+            select(func.max(AnalyticsSnapshot.taken_until))
+        )
+    cutoff = session.info["analytics_cutoff"]
+    if cutoff is None or sale.created_at >= cutoff:
+        return
+
+    shop_id = sale.shop_id or 0
+    stmt = _insert(session)(AnalyticsSnapshot).values([
+        {
+            "shop_id": shop_id, "metric": metric, "key": key,
+            "amount": sign * (sale.price or 0), "sale_count": sign * sale.quantity,
+            "taken_until": cutoff,
+        }
+        for metric, key in _analytics_keys(sale)
+    ])
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=["shop_id", "metric", "key"],
+        set_={
+            "amount": AnalyticsSnapshot.amount + stmt.excluded.amount,
+            "sale_count": AnalyticsSnapshot.sale_count + stmt.excluded.sale_count,
+        }
+    ))
+
+    if sign < 0:
+        await session.execute(delete(AnalyticsSnapshot).where(
+            AnalyticsSnapshot.shop_id == shop_id, AnalyticsSnapshot.sale_count <= 0
+        ))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_cutoff(session, transaction):
+    # The next transaction may run after a new snapshot was taken
+    session.info.pop("analytics_cutoff", None)
+
+
+async def _take_analytics(session, cutoff):
+    # Only the latest analytics snapshot is ever read
+    await session.execute(delete(AnalyticsSnapshot).where(AnalyticsSnapshot.taken_until < cutoff))
+
+    rows = union_all(*analytics_rows(until=cutoff)).subquery()
+    stmt = _insert(session)(AnalyticsSnapshot).from_select(
+        ["metric", "shop_id", "key", "amount", "sale_count", "taken_until"],
+        # WHERE: SQLite needs one between INSERT ... SELECT and ON CONFLICT
+        select(*rows.c, literal(cutoff, AnalyticsSnapshot.taken_until.type)).where(true())
+    )
+    await session.execute(stmt.on_conflict_do_nothing())
+
+
+def _render(kind, start_day, end_day, shop_number, summary):
+    if kind == "day":
+        title = f"📅 Итоги дня {start_day.strftime('%d.%m.%Y')}"
+    else:
+        title = f"📅 Итоги недели {start_day.strftime('%d.%m')} – {end_day.strftime('%d.%m.%Y')}"
+
+    text = (
+        f"{title} — магазин №{shop_number}\n"
+        f"━━━━━━━━━━━━━━━━━━\n"
+        f"💰 Выручка: {summary['revenue']:.2f}\n"
+        f"📦 Продано: {summary['items']} шт.\n"
+        f"📊 Средняя цена за единицу: {summary['revenue'] / summary['items']:.2f}\n"
+    )
+    if summary["top_products"]:
+        text += "\n🏆 Топ товаров (кол-во):\n"
+        for name, count in summary["top_products"]:
+            text += f"• {name}: {count} шт.\n"
+    return text
+
+
+async def _take_summaries(session, kind, start_day, end_day, cutoff):
+    """
+    Store per-shop summaries of [start_day, end_day] from the rollup.
+    Returns [(owner Telegram ID or None, message)] for the rows this call
+    inserted.
+    """
+    rows = (await session.execute(
+        select(
+            Shop.id, Shop.shop_number, User.telegram_id, Product.name,
+            func.sum(DailySalesRollup.sale_count).label("count"),
+            func.sum(DailySalesRollup.revenue).label("revenue"),
+        )
+        .select_from(DailySalesRollup)
+        .join(Shop, Shop.id == DailySalesRollup.shop_id)
+        .outerjoin(User, User.id == Shop.owner_id)
+        .outerjoin(Product, Product.id == DailySalesRollup.product_id)
+        .where(DailySalesRollup.day >= start_day, DailySalesRollup.day <= end_day)
+        .group_by(Shop.id, Shop.shop_number, User.telegram_id, Product.name)
+    )).all()
+
+    shops = {}
+    for row in rows:
+        shop = shops.setdefault(row.id, {
+            "number": row.shop_number, "owner": row.telegram_id,
+            "revenue": ZERO, "items": 0, "products": []
+        })
+        shop["revenue"] += row.revenue
+        shop["items"] += row.count
+        if row.name is not None:
+            shop["products"].append((row.name, row.count))
+
+    values = []
+    for shop_id, shop in shops.items():
+        if not shop["items"]:
+            continue
+        summary = {
+            "revenue": shop["revenue"],
+            "items": shop["items"],
+            "top_products": sorted(shop["products"], key=lambda p: (-p[1], p[0]))[:SUMMARY_TOP_N],
+        }
+        values.append({
+            "shop_id": shop_id,
+            "kind": kind,
+            "period_start": start_day,
+            "taken_until": cutoff,
+            "data": _dumps(summary),
+            "message": _render(kind, start_day, end_day, shop["number"], summary),
+        })
+    if not values:
+        return []
+
+    inserted = (await session.execute(
+        _insert(session)(ReportSnapshot).values(values)
+        .on_conflict_do_nothing(index_elements=["shop_id", "kind", "period_start"])
+        .returning(ReportSnapshot.shop_id, ReportSnapshot.message)
+    )).all()
+    return [(shops[shop_id]["owner"], message) for shop_id, message in inserted]
+
+
+async def take_snapshots(session, now=None, bot=None, push=SNAPSHOT_PUSH):
+    """
+    Snapshot everything up to the last midnight and, with `push`, send the
+    new day/week summaries to the shop owners. Returns the number of
+    summaries stored.
+    """
+    cutoff = datetime.combine((now or datetime.now()).date(), datetime.min.time())
+    yesterday = cutoff.date() - timedelta(days=1)
+
+    await _take_analytics(session, cutoff)
+    messages = await _take_summaries(session, "day", yesterday, yesterday, cutoff)
+    if cutoff.weekday() == 0:  # a week ended on Sunday
+        messages += await _take_summaries(session, "week", yesterday - timedelta(days=6), yesterday, cutoff)
+    await session.commit()
+
+    if push and bot:
+        for telegram_id, message in messages:
+            if telegram_id is None:
+                continue
+            try:
+                await bot.send_message(telegram_id, message, parse_mode=None)
+            except Exception as e:
+                print(f"Error sending report snapshot to {telegram_id}: {e}")
+    return len(messages)
+
+
+async def _due(session, now):
+    """True when the latest analytics snapshot predates the last midnight."""
+    latest = await session.scalar(select(func.max(AnalyticsSnapshot.taken_until)))
+    return latest is None or latest < datetime.combine(now.date(), datetime.min.time())
+
+
+def _seconds_until(hour, now):
+    run_at = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if run_at <= now:
+        run_at += timedelta(days=1)
+    return (run_at - now).total_seconds()
+
+
+async def run_periodically(bot=None, hour=SNAPSHOT_HOUR):
+    """
+    Background task: take the snapshots every night at `hour`. A missed
+    night (first start, downtime) is caught up right away.
+    """
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                now = datetime.now()
+                if await _due(session, now):
+                    stored = await take_snapshots(session, now, bot)
+                    print(f"📸 Report snapshots taken ({stored} summaries).")
+        except Exception as e:
+            print(f"Error taking report snapshots: {e}")
+        await asyncio.sleep(_seconds_until(hour, datetime.now()))
@@ -18,4 +18,5 @@ class ProductState(StatesGroup):
 
 class SaleState(StatesGroup):
     buyer_name = State()
+    cart = State()
     debt_payment = State()
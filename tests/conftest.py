@@ -0,0 +1,47 @@
+"""
+Tests run against a throwaway SQLite database (aiosqlite), created fresh
+for every test with the bot's own models.
+"""
+import os
+import tempfile
+
+# Before anything imports config: never touch the real database
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+
+import pytest
+
+from database import Base, engine, init_db, AsyncSessionLocal
+from models import User, Shop, Product
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def session():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.fixture
+async def product(session):
+    """One product (10 units at 10.00) in shop 1 of user 1."""
+    user = User(telegram_id=1, name="Owner", language="ru")
+    session.add(user)
+    await session.flush()
+    shop = Shop(shop_number=1, location="Test", owner_id=user.id)
+    session.add(shop)
+    await session.flush()
+    product = Product(
+        shop_id=shop.id, name="Chair", quantity=10, price=10, size_cm="50",
+        color="red", material="wood", status="available"
+    )
+    session.add(product)
+    await session.commit()
+    return product
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import select, func
+
+from fsm_storage import DatabaseStorage, dumps, loads
+from models import FsmRecord
+from states import SaleState
+
+pytestmark = pytest.mark.anyio
+
+KEY = StorageKey(bot_id=1, chat_id=2, user_id=3)
+
+
+def test_dates_and_text_survive_json():
+    data = {"start_date": datetime(2024, 1, 15, 9, 30), "buyer": "Анна", "cart": [[1, 2], [5, 1]]}
+    raw = dumps(data)
+    assert "Анна" in raw and " " not in raw  # compact, not \u-escaped
+    assert loads(raw) == data
+
+
+async def test_database_storage_round_trip(session):
+    storage = DatabaseStorage()
+    data = {"buyer": "Анна", "cart": [[1, 2]], "start_date": datetime(2024, 1, 15)}
+
+    await storage.set_state(KEY, SaleState.cart)
+    await storage.set_data(KEY, data)
+    assert await storage.get_state(KEY) == SaleState.cart.state
+    assert await storage.get_data(KEY) == data
+    assert await storage.active_count() == 1
+
+    # A cleared flow leaves no row behind
+    await storage.set_state(KEY, None)
+    await storage.set_data(KEY, {})
+    assert await storage.get_data(KEY) == {}
+    assert await session.scalar(select(func.count()).select_from(FsmRecord)) == 0
+
+
+async def test_expired_flow_is_not_revived(session):
+    storage = DatabaseStorage(ttl=-1)  # every write is already expired
+    await storage.set_data(KEY, {"buyer": "Анна"})
+    assert await storage.get_data(KEY) == {}
+
+    # A new flow starts clean instead of picking up the stale data
+    storage = DatabaseStorage()
+    await storage.set_state(KEY, SaleState.cart)
+    assert await storage.get_state(KEY) == SaleState.cart.state
+    assert await storage.get_data(KEY) == {}
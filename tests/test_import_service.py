@@ -0,0 +1,46 @@
+import io
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from models import Product
+from services.import_service import read_rows, import_products
+
+pytestmark = pytest.mark.anyio
+
+CSV = (
+    "Название;Количество;Цена;Размер;Цвет;Материал\n"
+    "Chair;3;12,50;50;red;wood\n"
+    "\n"
+    "Table;two;40;120;white;oak\n"
+    "Stool;1;-5;40;black;pine\n"
+    ";1;5;40;black;pine\n"
+    "Shelf;2;30;80;grey;birch\n"
+)
+
+
+def _rows(text, filename="products.csv"):
+    return read_rows(io.BytesIO(text.encode("utf-8-sig")), filename)
+
+
+async def test_invalid_rows_are_reported_by_file_line(session, product):
+    imported, errors = await import_products(session, product.shop_id, _rows(CSV))
+
+    assert imported == 2
+    # Line numbers count the header and the blank line
+    assert errors == [
+        (4, "количество должно быть целым числом"),
+        (5, "цена должна быть положительной"),
+        (6, "пустое поле «название»"),
+    ]
+    rows = await session.execute(
+        select(Product.name, Product.quantity, Product.price)
+        .where(Product.id != product.id).order_by(Product.id)
+    )
+    assert [tuple(row) for row in rows] == [("Chair", 3, Decimal("12.50")), ("Shelf", 2, Decimal("30.00"))]
+
+
+def test_missing_column_is_rejected():
+    with pytest.raises(ValueError, match="цена"):
+        list(_rows("name,quantity,size,color,material\nChair,1,50,red,wood\n"))
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy import select
+
+from handlers import debts
+from models import DailySalesRollup, Debt
+from services import rollup_service, snapshot_service
+from services.report_service import ranked_analytics, analytics_rows
+from services.sales_service import record_sale
+
+pytestmark = pytest.mark.anyio
+
+
+def _callback(data):
+    callback = MagicMock()
+    callback.data = data
+    callback.message.edit_text = AsyncMock()
+    callback.answer = AsyncMock()
+    return callback
+
+
+async def _rollup(session):
+    rows = await session.execute(select(
+        DailySalesRollup.shop_id, DailySalesRollup.day, DailySalesRollup.payment_type,
+        DailySalesRollup.product_id, DailySalesRollup.sale_count, DailySalesRollup.revenue
+    ))
+    return sorted(tuple(row) for row in rows if row.sale_count)
+
+
+async def _press(session, handler, action, sale):
+    """Press a debt button (as the debt list renders it) for `sale`."""
+    debt_id = await session.scalar(select(Debt.id).where(Debt.sale_id == sale.id))
+    callback = _callback(f"{action}:{debt_id}:{sale.id}")
+    await handler(callback)
+    assert "Error" not in callback.message.edit_text.call_args.args[0]
+
+
+async def test_rollup_and_snapshot_match_a_recount(session, product):
+    await record_sale(session, "Anna", [(product.id, 1)], "cash")
+    [(_, paid)] = await record_sale(session, "Boris", [(product.id, 2)], "borrowed")
+    [(_, returned)] = await record_sale(session, "Clara", [(product.id, 1)], "borrowed")
+    await snapshot_service.take_snapshots(session, now=datetime.now() + timedelta(days=1), push=False)
+
+    # Paid debts join the snapshot; the return takes a paid sale out again
+    await _press(session, debts.handle_card_payment, "pay_card", paid)
+    await _press(session, debts.handle_cash_payment, "pay_cash", returned)
+    await _press(session, debts.handle_product_return, "return", returned)
+    session.expire_all()
+
+    rollup = await _rollup(session)
+    analytics = await snapshot_service.current_analytics(session)
+    assert analytics["total_items"] == 3
+    assert [name for name, _ in analytics["top_buyers"]] == ["Boris", "Anna"]
+
+    await rollup_service.rebuild(session)
+    assert rollup == await _rollup(session)
+    assert analytics == await ranked_analytics(session, analytics_rows())
+    await session.rollback()
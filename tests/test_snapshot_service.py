@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from services import snapshot_service
+from services.report_service import ranked_analytics, analytics_rows
+from services.sales_service import record_sale
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_sale_made_before_the_cutoff_counts_once(session, product):
+    await record_sale(session, "Anna", [(product.id, 1)], "cash")
+    # A snapshot whose cutoff lies ahead (as when the app's clock is ahead
+    # of the database's) also covers the sales recorded after it was taken
+    await snapshot_service.take_snapshots(session, now=datetime.now() + timedelta(days=1), push=False)
+
+    await record_sale(session, "Boris", [(product.id, 2)], "card")
+
+    analytics = await snapshot_service.current_analytics(session)
+    assert analytics["total_amount"] == Decimal("30.00")
+    assert analytics["total_items"] == 3
+    assert analytics["top_products"] == [("Chair", Decimal("30.00"))]
+    assert analytics["top_buyers"] == [("Boris", Decimal("20.00")), ("Anna", Decimal("10.00"))]
+    assert analytics == await ranked_analytics(session, analytics_rows())
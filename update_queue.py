@@ -0,0 +1,96 @@
+"""
+Background processing of webhook updates.
+
+The webhook endpoint only validates an update and hands it to UpdateQueue,
+so Telegram gets its 200 immediately instead of waiting for handlers and
+the database. A fixed number of workers feed the updates to the
+dispatcher. Every chat is pinned to one worker, so updates of one
+conversation are still handled strictly in order (the FSM relies on it),
+while different chats run concurrently.
+"""
+import asyncio
+
+from aiogram.types.update import UpdateTypeLookupError
+
+
+class QueueFull(Exception):
+    pass
+
+
+def ordering_key(update):
+    """Chat id of the update (falls back to the sender, then the update id)."""
+    try:
+        event = update.event
+    except UpdateTypeLookupError:
+        return update.update_id
+
+    chat = getattr(event, "chat", None)
+    if chat is None and getattr(event, "message", None) is not None:
+        chat = event.message.chat  # callback queries
+    if chat is not None:
+        return chat.id
+
+    user = getattr(event, "from_user", None)
+    return user.id if user else update.update_id
+
+
+class UpdateQueue:
+    def __init__(self, dispatcher, bot, workers, queue_size):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.queues = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.tasks = []
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        self.tasks = [
+            asyncio.create_task(self._worker(queue), name=f"update-worker-{i}")
+            for i, queue in enumerate(self.queues)
+        ]
+
+    def enqueue(self, update):
+        queue = self.queues[hash(ordering_key(update)) % len(self.queues)]
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull()
+
+    async def _worker(self, queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.dispatcher.feed_update(bot=self.bot, update=update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Error processing update {update.update_id}: {e}")
+            finally:
+                queue.task_done()
+
+    def depth(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+    def stats(self):
+        return {
+            "workers": len(self.queues),
+            "depth": self.depth(),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    async def stop(self, timeout=10):
+        """Finish queued updates (up to `timeout` seconds), then stop the workers."""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self.queues)), timeout
+            )
+        except asyncio.TimeoutError:
+            print(f"⚠️ {self.depth()} queued updates dropped on shutdown.")
+
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)